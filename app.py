@@ -1,13 +1,21 @@
 import streamlit as st
-import pandas as pd
+import json
 import os
 import warnings
 import uuid
 from pathlib import Path
 
-from components.agent_workflow import build_text2sql_graph, AgentState
-from components.db_utils import create_db_from_csvs, execute_sql
-from components.ui_components import render_sidebar, render_data_preview, render_schema_view
+from components.agent_workflow import get_text2sql_graph, initial_state
+from components.checkpointer import resume_or_start
+from components.db_utils import create_db_from_csvs, read_db_meta
+from components.engines import ensure_duckdb_copy, resolve_engine
+from components.index_advisor import list_advised_indexes, schedule_index_advice
+from components.llm_client import get_llm_client
+from components.query_results import PagedQuery, open_paged_query
+from components.result_cache import get_result_cache
+from components.sql_cache import get_sql_cache
+from components.tracing import write_trace_records
+from components.ui_components import render_sidebar, render_data_preview, render_schema_view, render_sql_cache_stats, render_result_cache_stats, render_llm_client_stats, render_paged_results, render_index_report, render_ingest_progress, render_timing_breakdown
 
 warnings.filterwarnings('ignore')
 
@@ -30,7 +38,7 @@ DATA_DIR = Path("./data")
 DATA_DIR.mkdir(exist_ok=True)
 
 # Render sidebar with configuration options
-api_key, model_name, max_revisions, temperature = render_sidebar()
+api_key, model_name, max_revisions, temperature, graph_mode, engine = render_sidebar()
 
 # Main area for file upload and question input
 st.header("📁 Upload Your CSV Files")
@@ -43,30 +51,55 @@ if 'db_info' not in st.session_state:
     st.session_state.uploaded = False
     st.session_state.csv_files = []
     st.session_state.file_paths = []
-    st.session_state.dataframes = {}
+    st.session_state.tables = {}
 
-# Process uploaded files
-if uploaded_files and not st.session_state.uploaded:
-    # Process uploads and create database
-    db_path, table_schemas, dataframes = create_db_from_csvs(uploaded_files, DATA_DIR)
+# Process uploaded files again whenever the set of files changes
+upload_key = tuple((uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+                   for uploaded_file in uploaded_files or [])
+if uploaded_files and st.session_state.get('upload_key') != upload_key:
+    # Process uploads and create database; tables whose file is unchanged (or only had rows
+    # appended) are carried over from the previous database instead of loaded again
+    # Files are parsed in parallel; show how far each one has been loaded
+    progress = render_ingest_progress([uploaded_file.name for uploaded_file in uploaded_files])
+    db_path, table_schemas, tables = create_db_from_csvs(uploaded_files, DATA_DIR, progress=progress)
     
     # Store in session state
     st.session_state.db_info = db_path
     st.session_state.table_schemas = table_schemas
-    st.session_state.dataframes = dataframes
+    # Only lazy table handles are kept; rows and profiles are read from SQLite when shown
+    st.session_state.tables = tables
     st.session_state.uploaded = True
+    st.session_state.upload_key = upload_key
     
-    st.success(f"Successfully loaded {len(uploaded_files)} CSV files into SQLite database")
+    actions = list(json.loads(read_db_meta(db_path, 'table_actions') or '{}').values())
+    reused = []
+    if actions.count("keep"):
+        reused.append(f"{actions.count('keep')} unchanged")
+    if actions.count("append"):
+        reused.append(f"{actions.count('append')} with appended rows only")
+    st.success(f"Successfully loaded {len(uploaded_files)} CSV files into SQLite database"
+               + (f" (reused tables: {', '.join(reused)})" if reused else ""))
 
 # Display loaded files
 if st.session_state.uploaded:
     st.header("📊 Loaded Data")
     
     # Display data preview with statistics
-    render_data_preview(st.session_state.dataframes)
+    render_data_preview(st.session_state.tables)
     
     # Display tables and schemas
     render_schema_view(st.session_state.table_schemas)
+    render_index_report(list_advised_indexes(st.session_state.db_info))
+    
+    # The DuckDB engine queries a columnar copy of the tables, built once per dataset
+    engine = resolve_engine(engine)
+    if engine == "duckdb":
+        try:
+            with st.spinner("Preparing the DuckDB copy of your tables..."):
+                ensure_duckdb_copy(st.session_state.db_info)
+        except Exception as e:
+            st.warning(f"DuckDB is unavailable ({e}); using SQLite instead.")
+            engine = "sqlite"
     
     # Question input
     st.header("❓ Ask a Question")
@@ -89,67 +122,98 @@ if st.session_state.uploaded:
             with col1:
                 st.subheader("🔄 Processing")
                 processing_area = st.empty()
+                # SQL tokens from the writer, shown live as they stream in
+                live_sql_area = st.empty()
                 
-                # Build graph and prepare initial state
-                graph = build_text2sql_graph(model_name, temperature)
+                # Get the shared compiled graph and prepare initial state
+                graph = get_text2sql_graph(model_name, temperature, graph_mode, api_key=api_key)
                 
                 # Initial state
-                initial_state = {
-                    'question': question,
-                    'table_schemas': st.session_state.table_schemas,
-                    'database': "",
-                    'db_path': st.session_state.db_info,
-                    'sql': "",
-                    'accepted': False,
-                    'reflect': [],
-                    'revision': 0,
-                    'max_revision': max_revisions,
-                    'csv_files': st.session_state.csv_files
-                }
+                state = initial_state(question, st.session_state.table_schemas, st.session_state.db_info,
+                                      max_revisions, st.session_state.csv_files, engine)
                 
-                # Track execution
-                thread = {"configurable": {"thread_id": str(uuid.uuid4())}}
+                # Track execution; a run of the same question that failed earlier in this session
+                # resumes from its last checkpoint instead of repeating finished LLM calls
+                run_key = (st.session_state.db_info, question, model_name, graph_mode, engine, temperature, max_revisions)
+                pending_runs = st.session_state.setdefault('pending_runs', {})
+                thread = {"configurable": {"thread_id": pending_runs.setdefault(run_key, str(uuid.uuid4()))}}
+                graph_input = resume_or_start(graph, thread, state)
+                if graph_input is None:
+                    status_text.text("Resuming the interrupted run")
                 steps = []
                 
                 total_steps = max_revisions * 2 + 2  # Approximate max steps
                 step_count = 0
                 
-                # Process each step in the graph
-                for s in graph.stream(initial_state, thread):
+                live_sql = ""
+                live_revision = None
+                
+                # Process each step in the graph; custom events carry the writer's streamed tokens
+                for stream_mode, s in graph.stream(graph_input, thread, stream_mode=["updates", "custom"]):
+                    if stream_mode == "custom":
+                        if s.get("type") == "sql_token":
+                            if s["revision"] != live_revision:
+                                live_sql, live_revision = "", s["revision"]
+                            live_sql += s["text"]
+                            live_sql_area.markdown(live_sql)
+                        continue
                     step_count += 1
                     step_name = list(s.keys())[0] if isinstance(s, dict) else "processing"
-                    steps.append(f"Step {step_count}: {step_name}")
+                    update = s.get(step_name) if isinstance(s, dict) else None
+                    step_trace = (update or {}).get('trace') or []
+                    if step_trace:
+                        steps.append(f"Step {step_count}: {step_name} ({step_trace[-1]['wall_seconds']:.2f}s)")
+                    else:
+                        steps.append(f"Step {step_count}: {step_name}")
                     progress = min(step_count / total_steps, 0.9)
                     progress_bar.progress(progress)
                     status_text.text(f"Running agent: {step_name}")
                     processing_area.text('\n'.join(steps))
+                    if step_name == "sql_writer":
+                        live_sql_area.empty()
                 
                 # Get final state
                 final_state = graph.get_state(thread)
                 final_sql = final_state.values['sql']
+                cache_hit = final_state.values.get('cache_hit', False)
+                trace = final_state.values.get('trace', [])
+                
+                # Per-node timings go to the UI and to the shared JSON lines trace file. Every rerun
+                # (e.g. a page change) runs the graph again and hits the SQL cache; only runs that
+                # did the work are recorded.
+                if not cache_hit:
+                    write_trace_records(trace, source="app", model=model_name, mode=graph_mode, engine=engine)
+                
+                # Let the index advisor look for full table scans in newly accepted SQL (SQLite indexes
+                # only); SQL cache hits were accepted, and advised, on an earlier run
+                if final_state.values.get('accepted') and not cache_hit and engine == "sqlite":
+                    schedule_index_advice(st.session_state.db_info, final_sql)
+
+                # The run finished, so its checkpoints are no longer needed
+                graph.checkpointer.delete_thread(thread["configurable"]["thread_id"])
+                del pending_runs[run_key]
                 
                 progress_bar.progress(1.0)
-                status_text.text("Processing complete!")
+                status_text.text("Answered from SQL cache" if cache_hit else "Processing complete!")
+                render_timing_breakdown(trace)
                 
             # Display SQL and results in second column
             with col2:
                 st.subheader("🔍 Generated SQL")
                 st.code(final_sql, language="sql")
                 
-                # Execute SQL
+                # Open a paged view of the results, reused across reruns for the same query (it keeps no
+                # cursor open between pages); results read to the end are shared through the result cache
                 st.subheader("📊 Query Results")
                 try:
-                    results = execute_sql(st.session_state.db_info, final_sql)
-                    if isinstance(results, pd.DataFrame):
-                        st.dataframe(results, use_container_width=True)
-                        
-                        # Add export options
-                        st.download_button(
-                            label="Download Results as CSV",
-                            data=results.to_csv(index=False).encode('utf-8'),
-                            file_name=f"query_results_{uuid.uuid4().hex[:8]}.csv",
-                            mime="text/csv"
-                        )
+                    paged_key = (st.session_state.db_info, final_sql, engine)
+                    if st.session_state.get('paged_key') != paged_key:
+                        st.session_state.paged_query = open_paged_query(st.session_state.db_info, final_sql, engine=engine)
+                        st.session_state.paged_key = paged_key
+                    
+                    results = st.session_state.paged_query
+                    if isinstance(results, PagedQuery):
+                        render_paged_results(results, st.session_state.db_info, final_sql)
                     else:
                         st.error(f"Error executing SQL: {results}")
                 except Exception as e:
@@ -160,6 +224,11 @@ if st.session_state.uploaded:
 else:
     if not uploaded_files:
         st.info("Please upload at least one CSV file to continue")
+
+# Show cache counters after any question has been processed
+render_sql_cache_stats(get_sql_cache().stats())
+render_result_cache_stats(get_result_cache().stats())
+render_llm_client_stats(get_llm_client().stats())
     
 # Add footer with instructions
 st.markdown("---")
@@ -170,5 +239,5 @@ st.markdown("""
 3. Ask a question in natural language about your data
 4. The agent will convert your question to SQL and show the results
 
-**Note:** Your data remains on your local machine and is not sent to external servers other than the LLM API.
+**Note:** Your data remains on your local machine. Prompts sent to the LLM API include your question, table and column names, a few sample values from text columns and column statistics, but never full tables or query results.
 """)
\ No newline at end of file
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fake_llm import FakeChatGroq
+
+_MESSAGE_TYPES = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+
+class _Server(ThreadingHTTPServer):
+    # Concurrent benchmark clients would overflow the default listen backlog of 5
+    request_queue_size = 128
+    daemon_threads = True
+
+class FakeGroqEndpoint:
+    """Local HTTP server speaking Groq's chat completions API (plain and streamed), answering like
+    FakeChatGroq after a delay. Every rate_limit_every-th request gets a 429 with a Retry-After
+    header instead, so retries and backoff of the real ChatGroq client can be exercised offline.
+
+    Point a client at it with ChatGroq(base_url=endpoint.base_url, api_key="fake", ...).
+    """
+
+    def __init__(self, answers=None, default_sql="SELECT 1", delay_seconds=0.0, token_delay_seconds=0.0,
+                 rate_limit_every=0, retry_after_seconds=0.0, host="127.0.0.1", port=0):
+        self.model = FakeChatGroq(answers=answers or {}, default_sql=default_sql)
+        self.delay_seconds = delay_seconds
+        self.token_delay_seconds = token_delay_seconds
+        self.rate_limit_every = rate_limit_every
+        self.retry_after_seconds = retry_after_seconds
+        self.requests = 0
+        self.rate_limited = 0
+        # Requests being answered right now, and the most seen at once
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited, "max_active": self.max_active}
+
+    # Count a request; returns False when it should be answered with a 429
+    def _admit(self):
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return False
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            return True
+
+    def _done(self):
+        with self._lock:
+            self.active -= 1
+
+    def _respond(self, body):
+        messages = [_MESSAGE_TYPES.get(message.get("role"), HumanMessage)(content=message.get("content") or "")
+                    for message in body.get("messages", [])]
+        content = self.model._respond(messages)
+        prompt_tokens = sum(len(message.content) for message in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": max(len(content) // 4, 1)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return content, self.model._tokens(messages), usage
+
+    def _handler(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_event(self, payload):
+                data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                if not endpoint._admit():
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens",
+                                                    "code": "rate_limit_exceeded"}},
+                                    {"Retry-After": str(endpoint.retry_after_seconds)})
+                    return
+                try:
+                    time.sleep(endpoint.delay_seconds)
+                    content, tokens, usage = endpoint._respond(body)
+                    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                    common = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "fake")}
+                    if not body.get("stream"):
+                        self._send_json(200, {**common, "object": "chat.completion", "choices": [{
+                            "index": 0, "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop"}], "usage": usage})
+                        return
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    chunk = {**common, "object": "chat.completion.chunk"}
+                    try:
+                        for position, token in enumerate(tokens):
+                            if position:
+                                time.sleep(endpoint.token_delay_seconds)
+                            delta = {"role": "assistant", "content": token} if position == 0 else {"content": token}
+                            self._send_event({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                        # Groq reports usage on the last chunk
+                        self._send_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                          "x_groq": {"id": completion_id, "usage": usage}})
+                        self._send_event("[DONE]")
+                        self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client closed the stream early (e.g. the writer's stop condition)
+                        self.close_connection = True
+                finally:
+                    endpoint._done()
+
+        return Handler
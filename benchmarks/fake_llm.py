@@ -0,0 +1,99 @@
+import asyncio
+import re
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from components.agent_workflow import DIALECT_ROLES
+
+class FakeChatGroq(BaseChatModel):
+    """Deterministic local stand-in for ChatGroq that answers with canned SQL after a fixed delay"""
+
+    # SQL returned when the question contains the key (first match wins)
+    answers: Dict[str, str] = {}
+    # SQL returned for any other question
+    default_sql: str = "SELECT 1"
+    # Simulated network and generation time per call, in seconds (before the first token when streaming)
+    delay_seconds: float = 0.0
+    # Extra time per streamed token
+    token_delay_seconds: float = 0.0
+    # Explanation appended after the SQL block, as real models tend to do
+    explanation: str = "This query answers the question using the tables and columns in the schema."
+    model_name: str = "fake"
+    temperature: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-groq"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        system = messages[0].content if messages else ""
+        if any(system == roles['sql_validator']['system'] for roles in DIALECT_ROLES.values()):
+            return "ACCEPTED"
+        if any(system == roles['sql_improver']['system'] for roles in DIALECT_ROLES.values()):
+            return "The query looks correct; keep it as it is."
+
+        prompt = messages[-1].content if messages else ""
+        sql = next((sql for key, sql in self.answers.items() if key in prompt), self.default_sql)
+        return f"```sql\n{sql}\n```\n\n{self.explanation}"
+
+    # Rough token counts (about four characters per token) so traces show plausible usage
+    def _usage(self, messages: List[BaseMessage], content: str, prompt: bool = True):
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4 if prompt else 0
+        completion_tokens = max(len(content) // 4, 1)
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        content = self._respond(messages)
+        message = AIMessage(content=content, usage_metadata=self._usage(messages, content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    # Split a response into word-sized tokens, keeping whitespace and newlines
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        return re.findall(r'\s*\S+|\s+', self._respond(messages))
+
+    def _chunk(self, messages: List[BaseMessage], token: str, first: bool) -> ChatGenerationChunk:
+        # Usage is reported per chunk and adds up when chunks are merged
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content=token, usage_metadata=self._usage(messages, token, prompt=first)))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.delay_seconds)
+        for position, token in enumerate(self._tokens(messages)):
+            if position:
+                time.sleep(self.token_delay_seconds)
+            yield self._chunk(messages, token, position == 0)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.delay_seconds)
+        for position, token in enumerate(self._tokens(messages)):
+            if position:
+                await asyncio.sleep(self.token_delay_seconds)
+            yield self._chunk(messages, token, position == 0)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> ChatResult:
+        time.sleep(self.delay_seconds)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> ChatResult:
+        await asyncio.sleep(self.delay_seconds)
+        return self._result(messages)
+
+# A chat_model_factory for build_text2sql_graph that returns FakeChatGroq models
+def fake_chat_model_factory(answers=None, default_sql="SELECT 1", delay_seconds=0.0, token_delay_seconds=0.0):
+    def factory(model_name, temperature=0.0, api_key=None):
+        return FakeChatGroq(answers=answers or {}, default_sql=default_sql, delay_seconds=delay_seconds,
+                            token_delay_seconds=token_delay_seconds, model_name=model_name,
+                            temperature=temperature)
+    return factory
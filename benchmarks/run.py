@@ -0,0 +1,324 @@
+"""Offline benchmarks for ingestion, the agent graph and query execution.
+
+Usage:
+    python -m benchmarks.run --rows 200000 --columns 8 --files 4 --output benchmark_results.json
+
+No Groq key or network access is needed: the graph runs against FakeChatGroq, which
+returns canned SQL after --llm-delay seconds. The execute scenario runs the same queries
+on each of --engines (SQLite, and DuckDB when installed) and reports the speedup over
+SQLite, plus the latency of repeats answered from the result cache. The llm scenario sends
+concurrent requests through the shared LLM client to a local fake Groq endpoint that answers
+some of them with 429s, and reports latency, queue wait, retries and coalesced calls. Each scenario runs
+in a fresh process so its peak RSS is its own. Results are written as JSON (one object
+per scenario with rows/s, p50/p95 latency and peak RSS) so runs can be compared for
+regressions.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_data import generate_csvs
+from components.agent_workflow import GRAPH_MODES
+from components.engines import ENGINES, available_engines
+
+SCENARIOS = ("ingest", "graph", "execute", "llm")
+
+def _latency_stats(seconds):
+    seconds = np.asarray(seconds, dtype=float)
+    return {
+        "iterations": int(seconds.size),
+        "mean_seconds": round(float(seconds.mean()), 6),
+        "p50_seconds": round(float(np.percentile(seconds, 50)), 6),
+        "p95_seconds": round(float(np.percentile(seconds, 95)), 6),
+    }
+
+# Peak resident memory of this process and of its largest child, in MB
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (
+        round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    )
+
+def _load(csv_paths, db_dir):
+    from components.db_utils import create_db_from_csvs
+
+    db_dir = Path(db_dir)
+    db_dir.mkdir(parents=True, exist_ok=True)
+    files = [open(path, 'rb') for path in csv_paths]
+    try:
+        return create_db_from_csvs(files, db_dir)
+    finally:
+        for file in files:
+            file.close()
+
+def bench_ingest(config, csv_paths, work_dir):
+    timings = []
+    for _ in range(config["iterations"]):
+        # A fresh directory each time, or the content-addressed database would be reused
+        db_dir = Path(work_dir) / f"ingest_{uuid.uuid4().hex[:8]}"
+        started = time.perf_counter()
+        _load(csv_paths, db_dir)
+        timings.append(time.perf_counter() - started)
+
+    rows = config["rows"] * config["files"]
+    result = _latency_stats(timings)
+    result["rows_per_iteration"] = rows
+    result["rows_per_second"] = round(rows / float(np.median(timings)), 1)
+    return result
+
+def bench_graph(config, csv_paths, work_dir):
+    from benchmarks.fake_llm import fake_chat_model_factory
+    from components.agent_workflow import build_text2sql_graph, initial_state
+    from components.checkpointer import SQLiteCheckpointer
+    from components.llm_client import LLMClient, set_llm_client
+    from components.sql_cache import SQLCache
+    from components.tracing import summarize_trace
+
+    # The fake LLM has no rate limit to respect
+    set_llm_client(LLMClient(requests_per_minute=0))
+    db_path, table_schemas, _ = _load(csv_paths, Path(work_dir) / "graph")
+    table = "bench_0"
+    factory = fake_chat_model_factory(
+        answers={"how many": f"SELECT COUNT(*) FROM {table}"},
+        default_sql=f"SELECT category_1, AVG(amount_2) FROM {table} GROUP BY category_1",
+        delay_seconds=config["llm_delay"]
+    )
+    cache = SQLCache(Path(work_dir) / "sql_cache.db")
+    checkpointer = SQLiteCheckpointer(Path(work_dir) / "checkpoints.db")
+    graph = build_text2sql_graph("fake", 0.0, config["mode"], chat_model_factory=factory, cache=cache,
+                                 checkpointer=checkpointer)
+
+    timings = []
+    trace = []
+    for iteration in range(config["iterations"]):
+        # Distinct questions so every run misses the SQL cache and goes through the LLM nodes
+        question = f"How many rows are in {table}? (run {iteration})"
+        thread = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        state = initial_state(question, table_schemas, db_path, max_revision=2)
+        started = time.perf_counter()
+        for _ in graph.stream(state, thread):
+            pass
+        timings.append(time.perf_counter() - started)
+        trace.extend(graph.get_state(thread).values.get('trace', []))
+        graph.checkpointer.delete_thread(thread["configurable"]["thread_id"])
+
+    result = _latency_stats(timings)
+    result["llm_delay_seconds"] = config["llm_delay"]
+    result["mode"] = config["mode"]
+    # Per-node totals over all iterations
+    result["nodes"] = [
+        {key: round(value, 6) if isinstance(value, float) else value for key, value in node.items()}
+        for node in summarize_trace(trace)
+    ]
+    return result
+
+# Queries covering an aggregate, a filtered range scan and a wide result
+def _execute_queries(table):
+    return {
+        "count": f"SELECT COUNT(*) FROM {table}",
+        "group_by": f"SELECT category_1, COUNT(*), AVG(amount_2) FROM {table} GROUP BY category_1",
+        "date_range": f"SELECT * FROM {table} WHERE date_3 >= '2023-01-01' AND date_3 < '2023-02-01'",
+        "full_scan": f"SELECT * FROM {table}",
+    }
+
+def _bench_queries(config, db_path, engine):
+    from components.db_utils import QueryResult
+    from components.engines import execute_query
+    from components.query_results import execute_cached
+
+    results = {}
+    for name, sql_query in _execute_queries("bench_0").items():
+        timings = []
+        rows = 0
+        for _ in range(config["iterations"]):
+            started = time.perf_counter()
+            result = execute_query(db_path, sql_query, engine)
+            timings.append(time.perf_counter() - started)
+            if not isinstance(result, QueryResult):
+                raise RuntimeError(f"{name} failed on {engine}: {result}")
+            rows = result.row_count
+        results[name] = _latency_stats(timings)
+        results[name]["rows_returned"] = rows
+        # Every query reads the whole table, so throughput is table rows per second; rows returned
+        # would make a one-row aggregate over a large table look slow
+        results[name]["rows_scanned"] = config["rows"]
+        results[name]["rows_scanned_per_second"] = round(config["rows"] / max(float(np.median(timings)), 1e-9), 1)
+
+        # Repeats of the same query served by the result cache (the first call stores the result)
+        execute_cached(db_path, sql_query, engine)
+        cached = []
+        for _ in range(config["iterations"]):
+            started = time.perf_counter()
+            execute_cached(db_path, sql_query, engine)
+            cached.append(time.perf_counter() - started)
+        results[name]["cached"] = _latency_stats(cached)
+    return results
+
+# The same queries on every requested engine; the queries are valid in both dialects
+def bench_execute(config, csv_paths, work_dir):
+    from components.engines import ensure_duckdb_copy, resolve_engine
+
+    db_path, _, _ = _load(csv_paths, Path(work_dir) / "execute")
+    engines = {}
+    for engine in config["engines"]:
+        if resolve_engine(engine) != engine:
+            engines[engine] = {"skipped": f"{engine} is not installed"}
+            continue
+        result = {}
+        if engine == "duckdb":
+            # One-off cost of building the columnar copy from the SQLite tables
+            started = time.perf_counter()
+            ensure_duckdb_copy(db_path)
+            result["prepare_seconds"] = round(time.perf_counter() - started, 3)
+        result["queries"] = _bench_queries(config, db_path, engine)
+        engines[engine] = result
+
+    report = {"engines": engines}
+    measured = [engine for engine, result in engines.items() if "queries" in result]
+    if "sqlite" in measured and len(measured) > 1:
+        # p50 speedup of each engine over SQLite, per query
+        report["speedup_vs_sqlite"] = {
+            engine: {
+                name: round(stats["p50_seconds"] / max(engines[engine]["queries"][name]["p50_seconds"], 1e-9), 2)
+                for name, stats in engines["sqlite"]["queries"].items()
+            }
+            for engine in measured if engine != "sqlite"
+        }
+    return report
+
+def bench_llm(config, csv_paths, work_dir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from langchain_groq import ChatGroq
+
+    from benchmarks.fake_endpoint import FakeGroqEndpoint
+    from components.llm_client import LLMClient, new_call_info
+
+    requests = config["llm_requests"]
+    client = LLMClient(max_concurrency=config["llm_concurrency"], requests_per_minute=0)
+    latencies = []
+    queue_waits = []
+    batch_timings = []
+    with FakeGroqEndpoint(delay_seconds=config["llm_delay"], rate_limit_every=config["rate_limit_every"]) as endpoint:
+        # The real Groq client, talking HTTP to the local endpoint
+        model = ChatGroq(model_name="fake", temperature=0.0, api_key="fake", base_url=endpoint.base_url, max_retries=0)
+
+        def call(iteration, number):
+            # Every question is asked twice, so half of the calls can be coalesced
+            messages = [SystemMessage(content="You write SQLite queries."),
+                        HumanMessage(content=f"Question {number // 2} (run {iteration})")]
+            info = new_call_info()
+            started = time.perf_counter()
+            client.invoke(model, messages, info=info)
+            latencies.append(time.perf_counter() - started)
+            queue_waits.append(info["queue_wait_seconds"])
+
+        with ThreadPoolExecutor(max_workers=requests) as executor:
+            for iteration in range(config["iterations"]):
+                started = time.perf_counter()
+                list(executor.map(partial(call, iteration), range(requests)))
+                batch_timings.append(time.perf_counter() - started)
+        served = endpoint.stats()
+
+    # Latency per call; iterations counts batches
+    result = _latency_stats(latencies)
+    result["iterations"] = config["iterations"]
+    result["batch_p50_seconds"] = round(float(np.percentile(batch_timings, 50)), 6)
+    result["queue_wait_p95_seconds"] = round(float(np.percentile(queue_waits, 95)), 6)
+    result["requests_per_batch"] = requests
+    result["max_concurrency"] = config["llm_concurrency"]
+    result["client"] = client.stats()
+    # Requests the endpoint saw (including 429s) and the most it answered at once
+    result["endpoint"] = served
+    return result
+
+_BENCHMARKS = {"ingest": bench_ingest, "graph": bench_graph, "execute": bench_execute, "llm": bench_llm}
+
+# Entry point of the per-scenario process
+def run_scenario(name, config, csv_paths):
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as work_dir:
+        started = time.perf_counter()
+        result = _BENCHMARKS[name](config, csv_paths, work_dir)
+        result["wall_seconds"] = round(time.perf_counter() - started, 3)
+    result["peak_rss_mb"], result["peak_child_rss_mb"] = _peak_rss_mb()
+    return result
+
+def run_benchmarks(config):
+    with tempfile.TemporaryDirectory(prefix="bench_data_") as data_dir:
+        csv_paths = [str(path) for path in generate_csvs(
+            data_dir, files=config["files"], rows=config["rows"], columns=config["columns"], seed=config["seed"]
+        )]
+        results = {}
+        context = multiprocessing.get_context("spawn")
+        for name in config["scenarios"]:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[name] = executor.submit(run_scenario, name, config, csv_paths).result()
+            print(f"{name}: {json.dumps(results[name])}", flush=True)
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": multiprocessing.cpu_count(),
+        },
+        "config": config,
+        "scenarios": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, the agent graph, SQL execution and LLM calls offline")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows per generated CSV file")
+    parser.add_argument("--columns", type=int, default=8, help="Columns per generated CSV file (at least 4)")
+    parser.add_argument("--files", type=int, default=2, help="Number of generated CSV files")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed runs per scenario")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="Seconds the fake LLM waits per call")
+    parser.add_argument("--llm-requests", type=int, default=32, help="Concurrent requests per llm scenario run")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Concurrency limit of the LLM client")
+    parser.add_argument("--rate-limit-every", type=int, default=5,
+                        help="The fake endpoint answers every Nth request with a 429 (0 for never)")
+    parser.add_argument("--mode", choices=GRAPH_MODES, default="full", help="Graph mode for the graph scenario")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(available_engines()),
+                        help="Query engines the execute scenario compares")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    config = {
+        "rows": args.rows,
+        "columns": max(args.columns, 4),
+        "files": args.files,
+        "iterations": args.iterations,
+        "llm_delay": args.llm_delay,
+        "llm_requests": args.llm_requests,
+        "llm_concurrency": args.llm_concurrency,
+        "rate_limit_every": args.rate_limit_every,
+        "mode": args.mode,
+        "engines": args.engines,
+        "scenarios": args.scenarios,
+        "seed": args.seed,
+    }
+    report = run_benchmarks(config)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Rows generated and written at a time, so large files never sit in memory whole
+GENERATE_CHUNK_ROWS = 100_000
+CATEGORIES = ["north", "south", "east", "west", "central"]
+# Column kinds cycled through after the leading id column
+COLUMN_KINDS = ["category", "amount", "date", "count", "flag", "label"]
+
+def _column_names(columns):
+    names = ["id"]
+    for position in range(1, columns):
+        names.append(f"{COLUMN_KINDS[(position - 1) % len(COLUMN_KINDS)]}_{position}")
+    return names
+
+def _generate_chunk(rng, names, start, rows):
+    data = {}
+    for name in names:
+        kind = name.rsplit('_', 1)[0]
+        if name == "id":
+            data[name] = np.arange(start, start + rows)
+        elif kind == "category":
+            data[name] = rng.choice(CATEGORIES, rows)
+        elif kind == "amount":
+            amounts = np.round(rng.gamma(2.0, 50.0, rows), 2)
+            # Some missing values so profiles and NULL handling are exercised
+            data[name] = np.where(rng.random(rows) < 0.02, np.nan, amounts)
+        elif kind == "date":
+            days = rng.integers(0, 5 * 365, rows)
+            data[name] = (np.datetime64('2020-01-01') + days).astype(str)
+        elif kind == "count":
+            data[name] = rng.integers(0, 1_000, rows)
+        elif kind == "flag":
+            data[name] = rng.choice(["true", "false"], rows)
+        else:
+            data[name] = np.char.add("item-", rng.integers(0, 50_000, rows).astype(str))
+    return pd.DataFrame(data)
+
+# Write `files` CSVs of `rows` rows and `columns` columns each; returns their paths
+def generate_csvs(out_dir, files=1, rows=100_000, columns=8, seed=0):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = _column_names(max(columns, 1))
+    paths = []
+    for file_number in range(files):
+        # Same seed, same bytes: repeated runs benchmark identical data
+        rng = np.random.default_rng(seed + file_number)
+        path = out_dir / f"bench_{file_number}.csv"
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for start in range(0, rows, GENERATE_CHUNK_ROWS):
+                chunk = _generate_chunk(rng, names, start, min(GENERATE_CHUNK_ROWS, rows - start))
+                chunk.to_csv(f, index=False, header=start == 0)
+            if rows == 0:
+                f.write(','.join(names) + '\n')
+        paths.append(path)
+    return paths
@@ -1,12 +1,28 @@
 from typing import TypedDict, List, Annotated
+from functools import lru_cache, partial
+import asyncio
+import contextvars
+import hashlib
 import operator
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import uuid
 import re
 
 from langchain_groq import ChatGroq
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import SystemMessage, HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+
+from components.checkpointer import get_checkpointer
+from components.db_utils import read_db_meta
+from components.engines import DEFAULT_ENGINE, ENGINE_DIALECTS, check_query, dry_run_query
+from components.profiling import read_profiles
+from components.schema_index import SchemaIndex
+from components.schema_serializer import profile_summaries, serialize_schema
+from components.sql_cache import get_sql_cache, make_cache_key
+from components.tracing import ainvoke_model, astream_model, invoke_model, stream_model, traced_node
 
 # Define the state that will be passed between agents
 class AgentState(TypedDict):
@@ -20,28 +36,49 @@ class AgentState(TypedDict):
     max_revision: int
     csv_files: List[str]
     db_path: str
+    cache_key: str
+    cache_hit: bool
+    sql_error: str
+    # fast/auto modes: the question has gone to the LLM validator loop
+    escalated: bool
+    # Query engine the SQL is written for and checked on (see components.engines)
+    engine: str
+    # One timing/token record per node run, see components.tracing
+    trace: Annotated[List[dict], operator.add]
+
+# State a new run of the graph starts from
+def initial_state(question, table_schemas, db_path, max_revision, csv_files=None, engine=DEFAULT_ENGINE) -> AgentState:
+    return {
+        'question': question,
+        'table_schemas': table_schemas,
+        'database': "",
+        'db_path': db_path,
+        'sql': "",
+        'accepted': False,
+        'reflect': [],
+        'revision': 0,
+        'max_revision': max_revision,
+        'csv_files': list(csv_files or []),
+        'cache_key': "",
+        'cache_hit': False,
+        'sql_error': "",
+        'escalated': False,
+        'engine': engine,
+        'trace': []
+    }
 
 # Define agent roles and prompts
 agent_roles = {
-    "schema_finder": {
-        "system": """You are a database schema expert who identifies relevant tables and fields needed to answer a question. You analyze the available tables and determine which ones contain the necessary information.
-        
-When examining the schema, consider:
-1. Which tables contain fields directly mentioned in the question
-2. Which tables might need to be joined to provide complete answers
-3. Which fields will be needed for filtering, grouping, or in the final output""",
-        "expected_output": "Identify only the most relevant tables and columns for this specific question. Be concise and precise."
-    },
     "sql_writer": {
         "system": """You are an expert SQLite developer who writes precise SQL queries based on database schemas. Your queries should be optimized and follow SQLite-specific syntax rules.
         
 CRITICAL SQLite-specific rules to follow:
 1. PRAGMA statements are not tables and cannot be used in FROM clauses.
    - INCORRECT: `SELECT * FROM PRAGMA table_info('tablename')`
-   - CORRECT:   `PRAGMA table_info('tablename')`
+   - CORRECT:   `SELECT * FROM pragma_table_info('tablename')`
    
 2. To count columns in a table, use one of these approaches:
-   - Use `PRAGMA table_info('tablename')` and count the rows
+   - Use `SELECT COUNT(*) FROM pragma_table_info('tablename')`
    - Query the sqlite_master table: `SELECT sql FROM sqlite_master WHERE type='table' AND name='tablename'`
    
 3. Always use single quotes for string literals, not double quotes.
@@ -68,7 +105,7 @@ CRITICAL SQLite-specific rules to follow:
 When validating, be extremely vigilant about these common SQLite errors:
 1. PRAGMA misuse - PRAGMA commands cannot be used inside regular SQL queries as tables
    - INCORRECT: `SELECT * FROM PRAGMA table_info('tablename')` 
-   - CORRECT:   `PRAGMA table_info('tablename')` (as a standalone command)
+   - CORRECT:   `SELECT * FROM pragma_table_info('tablename')` (table-valued function)
 
 2. Using functions not available in SQLite
    - No support for PIVOT, MEDIAN, STDDEV
@@ -96,12 +133,12 @@ When improving queries, focus on these critical SQLite-specific issues:
 
 1. If you see `SELECT ... FROM PRAGMA table_info(...)`, this is completely invalid! 
    - PRAGMA is a special command, not a table to select from
-   - Instead use `PRAGMA table_info(tablename)` as a standalone command
+   - Instead use the table-valued function `SELECT * FROM pragma_table_info(tablename)`
    - Or use `SELECT count(*) FROM pragma_table_info(tablename)` to count columns
    
 2. Handling metadata queries properly:
    - Use `SELECT name FROM sqlite_master WHERE type='table'` to list tables
-   - Use `PRAGMA table_info(tablename)` to get column information
+   - Use `SELECT * FROM pragma_table_info(tablename)` to get column information
    
 3. SQLite performance best practices:
    - Ensure proper indexing for large tables
@@ -117,6 +154,110 @@ If the query uses PRAGMA incorrectly (trying to select from it as a table), expl
     }
 }
 
+# The same agents for DuckDB's dialect
+duckdb_agent_roles = {
+    "sql_writer": {
+        "system": """You are an expert DuckDB developer who writes precise analytical SQL queries based on database schemas. Your queries should be optimized and follow DuckDB syntax.
+
+Rules to follow:
+1. Always use single quotes for string literals and double quotes for identifiers that contain spaces or special characters.
+
+2. DATE and TIMESTAMP columns are native types:
+   - Compare them with typed literals: `WHERE order_date >= DATE '2023-01-01'`
+   - Use date_trunc('month', col), date_part('year', col), strftime(col, '%Y-%m') and interval arithmetic
+
+3. BOOLEAN columns hold true and false.
+
+4. DuckDB supports rich aggregates and window functions:
+   - median(), quantile_cont(), stddev(), string_agg(), count(DISTINCT ...)
+   - QUALIFY to filter on window functions, GROUP BY ALL to group by every non-aggregated column
+
+5. Integer division with / returns a decimal; use // for integer division.
+
+6. Only a single read-only SELECT or WITH statement is allowed. Files and other databases cannot be read.""",
+        "expected_output": "Write a complete and correct DuckDB query that answers the given question. Use only the tables and columns available in the schema."
+    },
+    "sql_validator": {
+        "system": """You are a DuckDB validation expert who checks if queries correctly answer the given question. You verify syntax, logic, and whether the query will return the information requested.
+
+When validating, watch for these common errors:
+1. Comparing DATE or TIMESTAMP columns with values in the wrong format instead of typed literals
+2. Treating BOOLEAN columns as integers or text
+3. Double-quoted string literals (double quotes are identifiers in DuckDB)
+4. Functions from other databases that DuckDB does not provide
+5. Columns or tables that are not in the schema
+
+Before accepting any query, verify that it doesn't contain any of these issues.""",
+        "expected_output": """Review the SQL query thoroughly. Respond with 'ACCEPTED' if the query is correct and will answer the question. Otherwise, explain the specific issues that need to be fixed."""
+    },
+    "sql_improver": {
+        "system": """You are a senior DuckDB engineer who provides specific feedback to improve SQL queries. You focus on correctness, performance, and alignment with the original question.
+
+When improving queries, focus on:
+1. Correct use of native DATE, TIMESTAMP and BOOLEAN columns
+2. DuckDB functions (date_trunc, strftime, median, quantile_cont, string_agg) in place of ones it lacks
+3. Window functions with QUALIFY instead of nested subqueries where that is simpler
+4. Returning only the columns and rows the question asks for""",
+        "expected_output": """Provide detailed, actionable feedback to fix any issues with the SQL query. Be specific about what needs to change and why."""
+    }
+}
+
+# Prompts per query engine
+DIALECT_ROLES = {"sqlite": agent_roles, "duckdb": duckdb_agent_roles}
+
+# Dialect rules repeated in every writer prompt
+WRITER_RULES = {
+    "sqlite": (
+        "VERY IMPORTANT SQLite RULES:\n"
+        "1. PRAGMA statements are NOT tables and CANNOT be used in FROM clauses!\n"
+        "   - INCORRECT: SELECT * FROM PRAGMA table_info('tablename')\n"
+        "   - CORRECT: SELECT * FROM pragma_table_info('tablename')\n"
+        "   - To count columns: SELECT COUNT(*) FROM pragma_table_info('tablename')\n"
+        "2. Use single quotes for string literals, not double quotes\n"
+        "3. SQLite does NOT support information_schema tables\n"
+        "4. Only a single read-only SELECT or WITH statement is allowed\n"
+        "5. DATE columns hold 'YYYY-MM-DD' text and TIMESTAMP columns 'YYYY-MM-DD HH:MM:SS' text; "
+        "compare them with literals in the same format. BOOLEAN columns hold 1 or 0\n\n"
+    ),
+    "duckdb": (
+        "VERY IMPORTANT DuckDB RULES:\n"
+        "1. Use single quotes for string literals and double quotes only for identifiers\n"
+        "2. DATE and TIMESTAMP columns are native types; compare them with DATE 'YYYY-MM-DD' or "
+        "TIMESTAMP 'YYYY-MM-DD HH:MM:SS' literals. BOOLEAN columns hold true or false\n"
+        "3. Only a single read-only SELECT or WITH statement is allowed\n"
+        "4. Files and other databases cannot be read (no read_csv, read_parquet or ATTACH)\n\n"
+    ),
+}
+
+# Checks listed in the validator and improver prompts
+VALIDATOR_CHECKS = {
+    "sqlite": (
+        "- Is it using PRAGMA incorrectly as a table? (e.g., SELECT * FROM PRAGMA...)\n"
+        "- Is it using functions not available in SQLite?\n"
+        "- Is it using proper SQLite syntax for metadata queries?\n"
+    ),
+    "duckdb": (
+        "- Are DATE, TIMESTAMP and BOOLEAN columns compared with values of the right type?\n"
+        "- Is it using functions not available in DuckDB?\n"
+        "- Are string literals in single quotes?\n"
+    ),
+}
+IMPROVER_CHECKS = {
+    "sqlite": (
+        "1. Is PRAGMA being used incorrectly? (e.g., SELECT * FROM PRAGMA...)\n"
+        "2. Are there any SQLite syntax errors?\n"
+        "3. Is the query using functions not available in SQLite?\n"
+    ),
+    "duckdb": (
+        "1. Are DATE, TIMESTAMP and BOOLEAN columns used as native types?\n"
+        "2. Are there any DuckDB syntax errors?\n"
+        "3. Is the query using functions not available in DuckDB?\n"
+    ),
+}
+
+def _engine(state: AgentState):
+    return state.get('engine') or DEFAULT_ENGINE
+
 # Extract SQL from response
 def extract_sql_from_response(response_text):
     # Try to extract SQL from code blocks first
@@ -150,44 +291,69 @@ def extract_sql_from_response(response_text):
     return sql
 
 # Define the agent nodes
-def schema_finder_node(state: AgentState, model):
-    messages = [
-        SystemMessage(content=agent_roles['schema_finder']['system']),
-        HumanMessage(
-            content=f"Based on these database schemas:\n{state['table_schemas']}\n\n"
-                   f"Find the relevant schemas to answer this question: {state['question']}\n\n"
-                   f"Consider which tables and columns would be needed for this specific query.\n\n"
-                   f"{agent_roles['schema_finder']['expected_output']}")
-    ]
-    response = model.invoke(messages)
-    
+def sql_cache_lookup_node(state: AgentState, cache):
+    # Fingerprint the full schema before schema_finder can narrow it
+    cache_key = make_cache_key(state['table_schemas'], state['question'], _engine(state))
+    sql = cache.get(cache_key)
+    if sql is None:
+        return {"cache_key": cache_key, "cache_hit": False}
+
     return {
-        "table_schemas": state['table_schemas'],  # Keep the original schema
+        "cache_key": cache_key,
+        "cache_hit": True,
+        "sql": sql,
+        "accepted": True
+    }
+
+def sql_cache_store_node(state: AgentState, cache):
+    cache.put(state['cache_key'], state['question'], state['sql'])
+    return {}
+
+# Load the schema index stored in a database at ingest time (None for older databases)
+@lru_cache(maxsize=32)
+def load_schema_index(db_path):
+    data = read_db_meta(db_path, 'schema_index')
+    return SchemaIndex.from_json(data) if data else None
+
+# Column statistics summarized from the profiles stored at ingest (empty for older databases)
+@lru_cache(maxsize=32)
+def load_profile_summaries(db_path):
+    return profile_summaries(read_profiles(db_path))
+
+def schema_finder_node(state: AgentState):
+    # Select relevant tables and columns locally instead of asking the LLM
+    schema_index = load_schema_index(state['db_path'])
+    if schema_index is None:
+        return {
+            "table_schemas": state['table_schemas'],  # Keep the original schema
+            "database": state['db_path']  # Keep the database path
+        }
+
+    # Compact, token-budgeted encoding of just the selected tables and columns
+    return {
+        "table_schemas": serialize_schema(schema_index.select(state['question']), schema_index.samples,
+                                          stats=load_profile_summaries(state['db_path'])),
         "database": state['db_path']  # Keep the database path
     }
 
-def sql_writer_node(state: AgentState, model):
+def _sql_writer_messages(state: AgentState):
+    engine = _engine(state)
+    roles = DIALECT_ROLES[engine]
     instruction = f"Using these database schemas:\n{state['table_schemas']}\n\n"
     
-    instruction += "VERY IMPORTANT SQLite RULES:\n"
-    instruction += "1. PRAGMA statements are NOT tables and CANNOT be used in FROM clauses!\n"
-    instruction += "   - INCORRECT: SELECT * FROM PRAGMA table_info('tablename')\n"
-    instruction += "   - CORRECT: PRAGMA table_info('tablename')\n"
-    instruction += "   - To count columns: SELECT COUNT(*) FROM pragma_table_info('tablename')\n"
-    instruction += "2. Use single quotes for string literals, not double quotes\n"
-    instruction += "3. SQLite does NOT support information_schema tables\n\n"
+    instruction += WRITER_RULES[engine]
     
     if state['reflect']:
         instruction += f"Consider this feedback from previous attempts:\n{state['reflect'][-1]}\n\n"
         
-    instruction += f"Write a SQLite-compatible SQL query to answer: {state['question']}\n\n{agent_roles['sql_writer']['expected_output']}"
+    instruction += f"Write a {ENGINE_DIALECTS[engine]}-compatible SQL query to answer: {state['question']}\n\n{roles['sql_writer']['expected_output']}"
     
-    messages = [
-        SystemMessage(content=agent_roles['sql_writer']['system']),
+    return [
+        SystemMessage(content=roles['sql_writer']['system']),
         HumanMessage(content=instruction)
     ]
-    response = model.invoke(messages)
-    
+
+def _sql_writer_result(state: AgentState, response):
     # Extract the SQL from the response
     sql_response = extract_sql_from_response(response.content)
     
@@ -196,22 +362,178 @@ def sql_writer_node(state: AgentState, model):
         "revision": state['revision'] + 1
     }
 
-def sql_validator_node(state: AgentState, model):
-    messages = [
-        SystemMessage(content=agent_roles['sql_validator']['system']),
+# A fenced SQL block has been closed, so the rest of the response is prose we do not need
+_COMPLETE_SQL_BLOCK = re.compile(r'```[^\n`]*\n.*?```', re.DOTALL)
+
+def sql_block_complete(text):
+    return _COMPLETE_SQL_BLOCK.search(text) is not None
+
+# Forward writer tokens to graph.stream(..., stream_mode="custom") consumers, if any
+def _token_emitter(state: AgentState):
+    try:
+        write = get_stream_writer()
+    except RuntimeError:
+        # Called outside a graph run
+        return None
+    revision = state['revision'] + 1
+    return lambda text: write({"type": "sql_token", "revision": revision, "text": text})
+
+def sql_writer_node(state: AgentState, model):
+    # Stream the response and stop generating once the SQL block is closed
+    response = stream_model(model, _sql_writer_messages(state), on_token=_token_emitter(state),
+                            stop=sql_block_complete)
+    return _sql_writer_result(state, response)
+
+async def asql_writer_node(state: AgentState, model):
+    response = await astream_model(model, _sql_writer_messages(state), on_token=_token_emitter(state),
+                                   stop=sql_block_complete)
+    return _sql_writer_result(state, response)
+
+def sql_checker_node(state: AgentState):
+    # Compile the query against the real database before spending an LLM call on it
+    error = check_query(state['db_path'], state['sql'], _engine(state))
+    if error is None:
+        return {"sql_error": ""}
+
+    return {
+        "sql_error": error,
+        "reflect": [f"The query failed local {ENGINE_DIALECTS[_engine(state)]} validation with this error:\n{error}\n\n"
+                    f"Query:\n{state['sql']}"]
+    }
+
+# Words that usually mean joins, grouping or multi-step logic the LLM validator should look at
+_COMPLEX_QUESTION = re.compile(
+    r'\b(join|compare|compared|comparison|versus|vs|each|per|rank|ranking|percent|percentage|ratio|'
+    r'difference|trend|over time|growth|correlat\w*|cumulative|running|median|both|neither|except)\b',
+    re.IGNORECASE
+)
+
+# A question over a single table without complexity hints is likely right on the first try
+def is_simple_question(question, table_schemas):
+    tables = sum(1 for line in table_schemas.splitlines() if line.startswith("Table: "))
+    return tables <= 1 and _COMPLEX_QUESTION.search(question) is None
+
+def question_router_node(state: AgentState):
+    # auto mode: send complex questions straight to the validator loop
+    return {"escalated": not is_simple_question(state['question'], state['table_schemas'])}
+
+def fast_checker_node(state: AgentState):
+    # Once escalated, behave like sql_checker and leave the rest to the LLM validator
+    if state.get('escalated', False):
+        return sql_checker_node(state)
+
+    # Otherwise a query that compiles against the database (read-only, nothing is executed) is
+    # accepted without an LLM review; running it here would only repeat the app's own execution,
+    # and a correct query that is slow on large data would be counted as a failure
+    error = check_query(state['db_path'], state['sql'], _engine(state))
+    if error is None:
+        return {"sql_error": "", "accepted": True}
+
+    return {
+        "sql_error": error,
+        "accepted": False,
+        "escalated": True,
+        "reflect": [f"The query failed local {ENGINE_DIALECTS[_engine(state)]} validation with this error:\n{error}\n\n"
+                    f"Query:\n{state['sql']}"]
+    }
+
+# Extract and dry-run one speculative candidate; returns the accepting update or None
+def _check_candidate(state: AgentState, response, candidates, errors):
+    sql = extract_sql_from_response(response.content)
+    if sql in candidates:
+        return None
+    candidates.append(sql)
+
+    error = dry_run_query(state['db_path'], sql, _engine(state))
+    if error is not None:
+        errors.append((sql, error))
+        return None
+
+    return {
+        "sql": sql,
+        "accepted": True,
+        "sql_error": "",
+        "revision": state['revision'] + 1
+    }
+
+def _speculative_failure(state: AgentState, candidates, errors):
+    feedback = '\n\n'.join(f"Query:\n{sql}\nError: {error}" for sql, error in errors)
+    return {
+        "sql": candidates[0] if candidates else "",
+        "accepted": False,
+        "sql_error": errors[0][1] if errors else "No SQL query was produced.",
+        "reflect": [f"None of the candidate queries passed local {ENGINE_DIALECTS[_engine(state)]} validation:\n\n{feedback}"],
+        "revision": state['revision'] + 1
+    }
+
+def speculative_writer_node(state: AgentState, models):
+    # Ask every model (one per temperature) for a candidate at the same time
+    messages = _sql_writer_messages(state)
+    executor = ThreadPoolExecutor(max_workers=len(models))
+    # Each call runs in a copy of this context so the node's trace sees its LLM time and tokens
+    futures = [
+        executor.submit(contextvars.copy_context().run, stream_model, model, messages, stop=sql_block_complete)
+        for model in models
+    ]
+
+    candidates = []
+    errors = []
+    try:
+        # Accept the first candidate that compiles and dry-runs cleanly
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                errors.append(("", f"Candidate request failed: {e}"))
+                continue
+            update = _check_candidate(state, response, candidates, errors)
+            if update is not None:
+                return update
+    finally:
+        # Do not wait for slower candidates once one has been accepted
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return _speculative_failure(state, candidates, errors)
+
+async def aspeculative_writer_node(state: AgentState, models):
+    messages = _sql_writer_messages(state)
+    tasks = [asyncio.ensure_future(astream_model(model, messages, stop=sql_block_complete)) for model in models]
+
+    candidates = []
+    errors = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                response = await next_done
+            except Exception as e:
+                errors.append(("", f"Candidate request failed: {e}"))
+                continue
+            # The dry run blocks on the database, so keep it off the event loop
+            update = await asyncio.to_thread(_check_candidate, state, response, candidates, errors)
+            if update is not None:
+                return update
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return _speculative_failure(state, candidates, errors)
+
+def _sql_validator_messages(state: AgentState):
+    engine = _engine(state)
+    roles = DIALECT_ROLES[engine]
+    return [
+        SystemMessage(content=roles['sql_validator']['system']),
         HumanMessage(
             content=f"Database schemas:\n{state['table_schemas']}\n\n"
                    f"SQL query to validate:\n{state['sql']}\n\n"
-                   f"Check if this SQLite query correctly answers: {state['question']}\n\n"
+                   f"Check if this {ENGINE_DIALECTS[engine]} query correctly answers: {state['question']}\n\n"
                    f"CRITICAL CHECKS:\n"
-                   f"- Is it using PRAGMA incorrectly as a table? (e.g., SELECT * FROM PRAGMA...)\n"
-                   f"- Is it using functions not available in SQLite?\n"
-                   f"- Is it using proper SQLite syntax for metadata queries?\n"
+                   f"{VALIDATOR_CHECKS[engine]}"
                    f"- Are all referenced tables and columns present in the schema?\n\n"
-                   f"{agent_roles['sql_validator']['expected_output']}")
+                   f"{roles['sql_validator']['expected_output']}")
     ]
-    response = model.invoke(messages)
-    
+
+def _sql_validator_result(response):
     # Check if the response indicates acceptance
     response_text = response.content.upper()
     accepted = ('ACCEPTED' in response_text and 
@@ -222,73 +544,190 @@ def sql_validator_node(state: AgentState, model):
         "accepted": accepted
     }
 
-def sql_improver_node(state: AgentState, model):
-    messages = [
-        SystemMessage(content=agent_roles['sql_improver']['system']),
+def sql_validator_node(state: AgentState, model):
+    return _sql_validator_result(invoke_model(model, _sql_validator_messages(state)))
+
+async def asql_validator_node(state: AgentState, model):
+    return _sql_validator_result(await ainvoke_model(model, _sql_validator_messages(state)))
+
+def _sql_improver_messages(state: AgentState):
+    engine = _engine(state)
+    roles = DIALECT_ROLES[engine]
+    return [
+        SystemMessage(content=roles['sql_improver']['system']),
         HumanMessage(
             content=f"Database schemas:\n{state['table_schemas']}\n\n"
                    f"Current SQL query with issues:\n{state['sql']}\n\n"
                    f"Provide specific feedback to better answer: {state['question']}\n\n"
-                   f"CRITICAL SQLite ISSUES TO CHECK:\n"
-                   f"1. Is PRAGMA being used incorrectly? (e.g., SELECT * FROM PRAGMA...)\n"
-                   f"2. Are there any SQLite syntax errors?\n"
-                   f"3. Is the query using functions not available in SQLite?\n"
+                   f"CRITICAL {ENGINE_DIALECTS[engine]} ISSUES TO CHECK:\n"
+                   f"{IMPROVER_CHECKS[engine]}"
                    f"4. Does the query correctly reference the available tables and columns?\n\n"
-                   f"{agent_roles['sql_improver']['expected_output']}")
+                   f"{roles['sql_improver']['expected_output']}")
     ]
-    response = model.invoke(messages)
-    
+
+def sql_improver_node(state: AgentState, model):
+    response = invoke_model(model, _sql_improver_messages(state))
+    return {
+        "reflect": [response.content]
+    }
+
+async def asql_improver_node(state: AgentState, model):
+    response = await ainvoke_model(model, _sql_improver_messages(state))
     return {
         "reflect": [response.content]
     }
 
-# Build the graph
-def build_text2sql_graph(model_name, temperature=0.0):
+# Graph topologies that build_text2sql_graph can compile
+GRAPH_MODES = ("full", "fast", "auto", "speculative")
+# Parallel candidates per revision in speculative mode
+SPECULATIVE_CANDIDATES = 3
+# Temperature added for each further speculative candidate
+SPECULATIVE_TEMPERATURE_STEP = 0.3
+
+# Chat clients and compiled graphs kept before the least recently used one is dropped
+MAX_CACHED_MODELS = 32
+MAX_CACHED_GRAPHS = 16
+
+# Process-wide caches so later questions reuse clients and compiled graphs
+_cache_lock = threading.Lock()
+_model_cache = OrderedDict()
+_graph_cache = OrderedDict()
+
+# Look up an entry in one of the caches above, marking it recently used (caller holds _cache_lock)
+def _cached(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+# Add an entry unless one was added concurrently, dropping the least recently used ones past
+# max_entries; returns the cached entry (caller holds _cache_lock)
+def _cache_entry(cache, key, value, max_entries):
+    value = cache.setdefault(key, value)
+    cache.move_to_end(key)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+    return value
+
+def _api_key_fingerprint(api_key):
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest() if api_key else None
+
+# Get a shared ChatGroq client (and its pooled HTTP connections) for these settings
+def get_chat_model(model_name, temperature=0.0, api_key=None):
+    key = (model_name, float(temperature), _api_key_fingerprint(api_key))
+    with _cache_lock:
+        model = _cached(_model_cache, key)
+        if model is None:
+            model_kwargs = {"api_key": api_key} if api_key else {}
+            # Retries and backoff happen in the shared LLM client, which also sees the wait
+            model = ChatGroq(
+                model_name=model_name,
+                temperature=temperature,
+                max_retries=0,
+                **model_kwargs
+            )
+            _cache_entry(_model_cache, key, model, MAX_CACHED_MODELS)
+    return model
+
+# Get a compiled graph shared by every session using the same settings
+def get_text2sql_graph(model_name, temperature=0.0, mode="full", api_key=None):
+    key = (model_name, float(temperature), mode, _api_key_fingerprint(api_key))
+    with _cache_lock:
+        graph = _cached(_graph_cache, key)
+    if graph is not None:
+        return graph
+
+    graph = build_text2sql_graph(model_name, temperature, mode, api_key)
+    with _cache_lock:
+        # Keep the first graph if another session compiled one concurrently
+        return _cache_entry(_graph_cache, key, graph, MAX_CACHED_GRAPHS)
+
+# Traced node that runs sync_node for graph.invoke/stream and async_node for ainvoke/astream
+def _llm_node(name, sync_node, async_node, model):
+    return traced_node(name, partial(sync_node, model=model), partial(async_node, model=model))
+
+# Build the graph (chat_model_factory, cache and checkpointer replace the Groq client, shared SQL cache
+# and shared checkpoint file, e.g. for benchmarks)
+def build_text2sql_graph(model_name, temperature=0.0, mode="full", api_key=None, chat_model_factory=None, cache=None,
+                         checkpointer=None):
+    if mode not in GRAPH_MODES:
+        raise ValueError(f"Unknown graph mode: {mode}")
+
     # Initialize LLM
-    model = ChatGroq(
-        model_name=model_name,
-        temperature=temperature
-    )
-    
-    # Create wrapper functions that include the model
-    def schema_finder_with_model(state):
-        return schema_finder_node(state, model)
-    
-    def sql_writer_with_model(state):
-        return sql_writer_node(state, model)
-    
-    def sql_validator_with_model(state):
-        return sql_validator_node(state, model)
-    
-    def sql_improver_with_model(state):
-        return sql_improver_node(state, model)
+    chat_model_factory = chat_model_factory or get_chat_model
+    model = chat_model_factory(model_name, temperature, api_key)
+    cache = cache if cache is not None else get_sql_cache()
+    checkpointer = checkpointer if checkpointer is not None else get_checkpointer()
     
     # Build the graph
     builder = StateGraph(AgentState)
     
-    # Add nodes
-    builder.add_node("schema_finder", schema_finder_with_model)
-    builder.add_node("sql_writer", sql_writer_with_model)
-    builder.add_node("sql_validator", sql_validator_with_model)
-    builder.add_node("sql_improver", sql_improver_with_model)
-    
-    # Add edges
-    builder.add_edge("schema_finder", "sql_writer")
-    builder.add_edge("sql_writer", "sql_validator")
-    builder.add_edge("sql_improver", "sql_writer")
+    # Add nodes shared by every mode
+    builder.add_node("sql_cache_lookup", traced_node("sql_cache_lookup", partial(sql_cache_lookup_node, cache=cache)))
+    builder.add_node("sql_cache_store", traced_node("sql_cache_store", partial(sql_cache_store_node, cache=cache)))
+    builder.add_node("schema_finder", traced_node("schema_finder", schema_finder_node))
     
-    # Add conditional edges
+    builder.add_edge("sql_cache_store", END)
     builder.add_conditional_edges(
-        "sql_validator",
-        lambda state: END if state['accepted'] or state['revision'] >= state['max_revision'] else "improve",
-        {END: END, "improve": "sql_improver"}
+        "sql_cache_lookup",
+        lambda state: END if state['cache_hit'] else "miss",
+        {END: END, "miss": "schema_finder"}
     )
     
-    # Set entry point
-    builder.set_entry_point("schema_finder")
+    if mode == "speculative":
+        # Parallel candidates checked locally, no LLM validator
+        temperatures = [min(1.0, temperature + i * SPECULATIVE_TEMPERATURE_STEP) for i in range(SPECULATIVE_CANDIDATES)]
+        models = [chat_model_factory(model_name, t, api_key) for t in temperatures]
+        builder.add_node("speculative_writer", traced_node(
+            "speculative_writer",
+            partial(speculative_writer_node, models=models),
+            partial(aspeculative_writer_node, models=models)
+        ))
+        builder.add_edge("schema_finder", "speculative_writer")
+        builder.add_conditional_edges(
+            "speculative_writer",
+            lambda state: "store" if state['accepted'] else END if state['revision'] >= state['max_revision'] else "retry",
+            {END: END, "store": "sql_cache_store", "retry": "speculative_writer"}
+        )
+    else:
+        # Writer, local check, LLM validator and improver loop
+        builder.add_node("sql_writer", _llm_node("sql_writer", sql_writer_node, asql_writer_node, model))
+        builder.add_node("sql_validator", _llm_node("sql_validator", sql_validator_node, asql_validator_node, model))
+        builder.add_node("sql_improver", _llm_node("sql_improver", sql_improver_node, asql_improver_node, model))
+        
+        builder.add_edge("sql_writer", "sql_checker")
+        builder.add_edge("sql_improver", "sql_writer")
+        
+        if mode == "full":
+            builder.add_node("sql_checker", traced_node("sql_checker", sql_checker_node))
+            builder.add_edge("schema_finder", "sql_writer")
+            builder.add_conditional_edges(
+                "sql_checker",
+                lambda state: "validate" if not state['sql_error'] else END if state['revision'] >= state['max_revision'] else "rewrite",
+                {END: END, "validate": "sql_validator", "rewrite": "sql_writer"}
+            )
+        else:
+            # One writer call and a local dry run; escalate to the validator loop only if that fails
+            builder.add_node("sql_checker", traced_node("sql_checker", fast_checker_node))
+            if mode == "auto":
+                builder.add_node("question_router", traced_node("question_router", question_router_node))
+                builder.add_edge("schema_finder", "question_router")
+                builder.add_edge("question_router", "sql_writer")
+            else:
+                builder.add_edge("schema_finder", "sql_writer")
+            builder.add_conditional_edges(
+                "sql_checker",
+                lambda state: "store" if state['accepted'] else "validate" if not state['sql_error'] else END if state['revision'] >= state['max_revision'] else "rewrite",
+                {END: END, "store": "sql_cache_store", "validate": "sql_validator", "rewrite": "sql_writer"}
+            )
+        builder.add_conditional_edges(
+            "sql_validator",
+            lambda state: "store" if state['accepted'] else END if state['revision'] >= state['max_revision'] else "improve",
+            {END: END, "store": "sql_cache_store", "improve": "sql_improver"}
+        )
     
-    # Use in-memory checkpoint
-    memory = MemorySaver()
+    # Set entry point
+    builder.set_entry_point("sql_cache_lookup")
     
-    # Compile graph
-    return builder.compile(checkpointer=memory)
\ No newline at end of file
+    # Checkpoints go to a bounded SQLite file, so interrupted runs can be resumed
+    return builder.compile(checkpointer=checkpointer)
@@ -0,0 +1,174 @@
+"""Headless batch mode: answer a JSONL file of questions against a directory of CSVs.
+
+Usage:
+    python -m components.batch_runner --data-dir ./datasets/shop --questions questions.jsonl \
+        --output results.jsonl --concurrency 8
+
+Each input line is a JSON object with a "question" and an optional "id". Each output
+line holds the generated SQL, a summary of the query results, the revision count, the
+latency of that question and its per-node timings. Per-node trace records are also
+appended to the trace file (see components.tracing). A question that fails keeps its
+graph checkpoints, so running the same batch again resumes it instead of repeating the
+LLM calls that already finished. GROQ_API_KEY must be set in the environment.
+
+Questions are answered through the app's persistent SQL cache unless --sql-cache-path
+points at another cache file or --no-sql-cache starts from an empty in-memory cache;
+regression runs should use one of those so repeated runs still reach the LLM. Each
+output line's "cache_hit" tells whether its SQL came from the cache.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+
+from components.agent_workflow import GRAPH_MODES, build_text2sql_graph, get_text2sql_graph, initial_state
+from components.checkpointer import aresume_or_start
+from components.db_utils import QueryResult, create_db_from_csvs
+from components.engines import ENGINES, ensure_duckdb_copy, resolve_engine
+from components.query_results import execute_cached
+from components.sql_cache import SQLCache
+from components.tracing import summarize_trace, write_trace_records
+
+# Rows of each result included in the output summary
+SUMMARY_PREVIEW_ROWS = 5
+
+# Load every CSV in a directory the same way the app loads uploads
+def load_dataset(data_dir, db_dir):
+    csv_paths = sorted(Path(data_dir).glob("*.csv"))
+    if not csv_paths:
+        raise FileNotFoundError(f"No CSV files found in {data_dir}")
+
+    db_dir.mkdir(parents=True, exist_ok=True)
+    files = [open(path, 'rb') for path in csv_paths]
+    try:
+        db_path, table_schemas, _ = create_db_from_csvs(files, db_dir)
+    finally:
+        for file in files:
+            file.close()
+    return db_path, table_schemas, [path.name for path in csv_paths]
+
+def read_questions(questions_path):
+    questions = []
+    with open(questions_path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append({"id": item.get("id", line_number), "question": item["question"]})
+    return questions
+
+# Summarize query results without writing the whole result set
+def summarize_results(results):
+    if not isinstance(results, QueryResult):
+        return {"error": results}
+    return {
+        "row_count": results.row_count,
+        "truncated": results.truncated,
+        "cancelled": results.cancelled,
+        "execution_seconds": round(results.elapsed, 3),
+        "columns": [str(column) for column in results.dataframe.columns],
+        "preview": json.loads(results.dataframe.head(SUMMARY_PREVIEW_ROWS).to_json(orient='records'))
+    }
+
+# Stable per question and settings, so a rerun of the same batch finds its checkpoints
+def batch_thread_id(item, db_path, trace_fields, max_revisions):
+    key = json.dumps([str(db_path), trace_fields["model"], trace_fields["mode"], trace_fields["engine"], max_revisions,
+                      str(item['id']), item['question']])
+    return "batch-" + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+async def answer_question(graph, item, db_path, table_schemas, csv_files, max_revisions, semaphore, trace_fields):
+    async with semaphore:
+        started = time.perf_counter()
+        thread = {"configurable": {"thread_id": batch_thread_id(item, db_path, trace_fields, max_revisions)}}
+        state = initial_state(item['question'], table_schemas, db_path, max_revisions, csv_files,
+                              trace_fields["engine"])
+        try:
+            # A run interrupted by an earlier failure or crash continues from its last checkpoint
+            final_state = await graph.ainvoke(await aresume_or_start(graph, thread, state), thread)
+        except Exception as e:
+            # Checkpoints are kept so rerunning the batch resumes this question
+            return {
+                "id": item['id'],
+                "question": item['question'],
+                "error": str(e),
+                "latency_seconds": round(time.perf_counter() - started, 3)
+            }
+        await graph.checkpointer.adelete_thread(thread["configurable"]["thread_id"])
+        latency = time.perf_counter() - started
+        write_trace_records(final_state['trace'], question_id=item['id'], **trace_fields)
+
+        if final_state['sql']:
+            # Questions that end in the same SQL share one execution through the result cache
+            results = await asyncio.to_thread(execute_cached, db_path, final_state['sql'], trace_fields["engine"])
+        else:
+            results = "No SQL query was produced."
+        return {
+            "id": item['id'],
+            "question": item['question'],
+            "sql": final_state['sql'],
+            "accepted": final_state['accepted'],
+            "cache_hit": final_state.get('cache_hit', False),
+            "revisions": final_state['revision'],
+            "latency_seconds": round(latency, 3),
+            "timings": summarize_trace(final_state['trace']),
+            "results": summarize_results(results)
+        }
+
+async def run_batch(args):
+    db_path, table_schemas, csv_files = load_dataset(args.data_dir, Path(args.db_dir))
+    questions = read_questions(args.questions)
+    if args.no_sql_cache or args.sql_cache_path:
+        # A cache of its own, so answers cached by the app or earlier runs are not reused
+        cache = SQLCache(":memory:" if args.no_sql_cache else args.sql_cache_path)
+        graph = build_text2sql_graph(args.model, args.temperature, args.mode, cache=cache)
+    else:
+        graph = get_text2sql_graph(args.model, args.temperature, args.mode)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    engine = resolve_engine(args.engine)
+    if engine != args.engine:
+        print(f"{args.engine} is not available, using {engine}")
+    if engine == "duckdb":
+        ensure_duckdb_copy(db_path)
+    trace_fields = {"source": "batch", "model": args.model, "mode": args.mode, "engine": engine}
+
+    tasks = [
+        answer_question(graph, item, db_path, table_schemas, csv_files, args.max_revisions, semaphore, trace_fields)
+        for item in questions
+    ]
+    # Write records as questions finish so partial results survive an interruption
+    cache_hits = 0
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for next_done in asyncio.as_completed(tasks):
+            record = await next_done
+            cache_hits += record.get("cache_hit", False)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    return len(questions), cache_hits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions without the Streamlit UI")
+    parser.add_argument("--data-dir", required=True, help="Directory containing the CSV files to load")
+    parser.add_argument("--questions", required=True, help="JSONL file with one {\"id\", \"question\"} per line")
+    parser.add_argument("--output", required=True, help="JSONL file to write results to")
+    parser.add_argument("--db-dir", default="./data", help="Directory for the generated SQLite database")
+    parser.add_argument("--model", default="llama3-8b-8192")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--mode", choices=GRAPH_MODES, default="full")
+    parser.add_argument("--engine", choices=ENGINES, default="sqlite", help="Query engine and SQL dialect")
+    parser.add_argument("--max-revisions", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions processed at the same time")
+    sql_cache = parser.add_mutually_exclusive_group()
+    sql_cache.add_argument("--sql-cache-path", help="SQL cache file to use instead of the app's shared cache")
+    sql_cache.add_argument("--no-sql-cache", action="store_true",
+                           help="Start from an empty in-memory SQL cache so every question reaches the LLM")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count, cache_hits = asyncio.run(run_batch(args))
+    print(f"Answered {count} questions ({cache_hits} from the SQL cache) in {time.perf_counter() - started:.1f}s, "
+          f"results in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+
+# Default location of the persistent graph checkpoints
+DEFAULT_CHECKPOINT_PATH = Path("./data") / "checkpoints.db"
+# Stored checkpoint and write bytes allowed before the least recently updated threads are evicted
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Threads not updated for this long are evicted
+DEFAULT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """Graph checkpoints in a local SQLite file with size and age based eviction of whole threads"""
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS, serde=None):
+        super().__init__(serde=serde)
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                checkpoint_type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                value_type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            )
+        """)
+        # Bytes and last update per thread, so eviction never has to scan the blobs
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS threads_updated ON threads (updated_at)")
+
+    def _touch(self, thread_id, added_bytes):
+        self._conn.execute(
+            "INSERT INTO threads (thread_id, updated_at, bytes) VALUES (?, ?, ?) "
+            "ON CONFLICT (thread_id) DO UPDATE SET updated_at = excluded.updated_at, "
+            "bytes = bytes + excluded.bytes",
+            (thread_id, time.time(), added_bytes)
+        )
+
+    def _delete_threads(self, thread_ids):
+        for table in ("checkpoints", "writes", "threads"):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in thread_ids])
+
+    # Drop expired threads, then the least recently updated ones until the file is within budget
+    def _evict(self, current_thread_id):
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT thread_id FROM threads WHERE updated_at < ? AND thread_id != ?",
+            (time.time() - self.max_age_seconds, current_thread_id)
+        )]
+        self._delete_threads(expired)
+
+        total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM threads").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for thread_id, size in self._conn.execute(
+            "SELECT thread_id, bytes FROM threads WHERE thread_id != ? ORDER BY updated_at", (current_thread_id,)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append(thread_id)
+            total -= size
+        self._delete_threads(evicted)
+
+    def _tuple(self, thread_id, checkpoint_ns, row):
+        checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = self._conn.execute(
+            "SELECT task_id, channel, value_type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id
+            }},
+            checkpoint=self.serde.loads_typed((checkpoint_type, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id
+            }} if parent_checkpoint_id else None),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ]
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = ("SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(query + " AND checkpoint_id = ?",
+                                         (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                # Checkpoint ids sort in creation order
+                row = self._conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1",
+                                         (thread_id, checkpoint_ns)).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row is not None else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, "
+                 "checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1")
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            query += " AND checkpoint_id < ?"
+            params.append(get_checkpoint_id(before))
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            tuples = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(tuples) >= limit:
+                    break
+                checkpoint_tuple = self._tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                tuples.append(checkpoint_tuple)
+        yield from tuples
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(
+            get_serializable_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     checkpoint_type, checkpoint_blob, metadata_type, metadata_blob)
+                )
+                self._touch(thread_id, len(checkpoint_blob) + len(metadata_blob))
+                self._evict(thread_id)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]
+        }}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, value_type, value_blob, task_path))
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are kept once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._touch(thread_id, sum(len(row[7]) for row in rows))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete_threads([thread_id])
+            self._conn.execute("COMMIT")
+
+    # Async variants run the SQLite work off the event loop
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self):
+        """Number of stored threads and checkpoints plus their total size in bytes"""
+        with self._lock:
+            threads, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM threads").fetchone()
+            checkpoints = self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            return {"threads": threads, "checkpoints": checkpoints, "bytes": size}
+
+# Input for graph.stream/invoke: None resumes a thread whose last run stopped before the end
+# (completed nodes, including their LLM calls, are not run again); otherwise the fresh state
+def resume_or_start(graph, config, initial_state):
+    snapshot = graph.get_state(config)
+    return None if snapshot.next else initial_state
+
+async def aresume_or_start(graph, config, initial_state):
+    snapshot = await graph.aget_state(config)
+    return None if snapshot.next else initial_state
+
+_default_checkpointer = None
+_default_checkpointer_lock = threading.Lock()
+
+# Get the process-wide checkpointer stored at DEFAULT_CHECKPOINT_PATH
+def get_checkpointer():
+    global _default_checkpointer
+    with _default_checkpointer_lock:
+        if _default_checkpointer is None:
+            _default_checkpointer = SQLiteCheckpointer()
+        return _default_checkpointer
@@ -0,0 +1,167 @@
+import re
+from dataclasses import dataclass
+
+import pandas as pd
+
+# Date formats tried in order after ISO 8601; the first that parses every sampled value wins
+DATE_FORMATS = ["%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S",
+                "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%d %b %Y", "%b %d, %Y"]
+# Spellings accepted as booleans (compared lowercase)
+BOOLEAN_VALUES = {"true": 1, "false": 0, "t": 1, "f": 0, "yes": 1, "no": 0, "y": 1, "n": 0}
+# Types columns are widened to when a later chunk does not fit the sampled type
+WIDER_TYPE = {"BOOLEAN": "TEXT", "INTEGER": "REAL", "REAL": "TEXT", "DATE": "TIMESTAMP", "TIMESTAMP": "TEXT"}
+# How each logical type is stored in a STRICT table
+STORAGE_TYPES = {"INTEGER": "INTEGER", "REAL": "REAL", "BOOLEAN": "INTEGER", "DATE": "TEXT", "TIMESTAMP": "TEXT",
+                 "TEXT": "TEXT"}
+# Normalized text formats, chosen so string comparison orders dates correctly
+DATE_OUTPUT_FORMAT = "%Y-%m-%d"
+TIMESTAMP_OUTPUT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_INTEGER = re.compile(r'^[+-]?\d+$')
+_GROUPED_NUMBER = re.compile(r'^[+-]?\d{1,3}(,\d{3})+(\.\d+)?$')
+_PLAIN_NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+_TIME_PART = r'\d[T ]\d{1,2}:\d{2}'
+
+@dataclass
+class ColumnType:
+    """Logical type of a CSV column plus what is needed to convert its text"""
+    logical: str = "TEXT"
+    # Values use thousands separators ("1,234.5")
+    thousands: bool = False
+    # strptime format for DATE/TIMESTAMP columns, or "ISO8601"
+    date_format: str = None
+
+    @property
+    def storage(self):
+        return STORAGE_TYPES[self.logical]
+
+    def widened(self):
+        """The next more general type, used when a value does not fit"""
+        if self.logical in ("INTEGER", "REAL") and not self.thousands:
+            # Thousands separators may first appear after the sampled rows
+            return ColumnType(self.logical, thousands=True)
+        wider = WIDER_TYPE.get(self.logical, "TEXT")
+        if wider == "REAL":
+            return ColumnType("REAL", thousands=self.thousands)
+        if wider == "TIMESTAMP":
+            return ColumnType("TIMESTAMP", date_format=self.date_format)
+        return ColumnType(wider)
+
+    def widened_for(self, values):
+        """The narrowest more general type that the given raw values fit, skipping steps they do not"""
+        column_type = self.widened()
+        while column_type.logical != "TEXT":
+            try:
+                _convert_column(None, values, column_type)
+                return column_type
+            except TypeMismatch:
+                column_type = column_type.widened()
+        return column_type
+
+class TypeMismatch(ValueError):
+    """Values in a chunk cannot be stored as their columns' inferred types"""
+
+    def __init__(self, values):
+        super().__init__(f"Columns {', '.join(map(repr, values))} have values that do not fit their inferred types")
+        # {column: raw values that did not fit}
+        self.values = values
+
+def _infer_date_format(values):
+    has_time = values.str.contains(_TIME_PART).any()
+    if values.str.match(r'^\d{4}-\d{2}-\d{2}').all():
+        if _parse_datetimes(values, "ISO8601").notna().all():
+            return "ISO8601", has_time
+    for date_format in DATE_FORMATS:
+        if _parse_datetimes(values, date_format).notna().all():
+            return date_format, has_time or '%H' in date_format
+    return None, False
+
+# Infer a ColumnType from a sample of raw (string) values
+def infer_column_type(values):
+    values = values.dropna().astype(str).str.strip()
+    values = values[values != ""]
+    if values.empty:
+        return ColumnType("TEXT")
+
+    if values.str.lower().isin(BOOLEAN_VALUES.keys()).all() and not values.str.match(r'^\d+$').any():
+        return ColumnType("BOOLEAN")
+
+    grouped = values.str.match(_GROUPED_NUMBER)
+    if (grouped | values.str.match(_PLAIN_NUMBER)).all():
+        numbers = values.str.replace(',', '', regex=False) if grouped.any() else values
+        # Zero-padded codes such as ZIP codes must keep their leading zeros
+        if numbers.str.match(r'^[+-]?0\d').any():
+            return ColumnType("TEXT")
+        if numbers.str.match(_INTEGER).all():
+            return ColumnType("INTEGER", thousands=bool(grouped.any()))
+        return ColumnType("REAL", thousands=bool(grouped.any()))
+
+    if values.str.match(r'^\d').all() or values.str.match(r'^[A-Za-z]{3} \d').all():
+        date_format, has_time = _infer_date_format(values)
+        if date_format is not None:
+            return ColumnType("TIMESTAMP" if has_time else "DATE", date_format=date_format)
+
+    return ColumnType("TEXT")
+
+# Infer {column: ColumnType} for a DataFrame read with dtype=str
+def infer_column_types(sample):
+    return {column: infer_column_type(sample[column]) for column in sample.columns}
+
+def _parse_datetimes(values, date_format):
+    # Values with offsets are normalized to UTC so stored text compares correctly
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce', utc=True)
+    return parsed.dt.tz_localize(None)
+
+# Convert one column of raw strings to its storage representation; raises TypeMismatch
+# with the raw values that do not fit
+def _convert_column(name, raw, column_type):
+    values = raw.str.strip()
+    present = values.notna() & (values != "")
+    values = values.where(present)
+    logical = column_type.logical
+
+    if logical == "TEXT":
+        return raw
+    if logical == "BOOLEAN":
+        converted = values.str.lower().map(BOOLEAN_VALUES)
+    elif logical in ("INTEGER", "REAL"):
+        numbers = values
+        if column_type.thousands:
+            # Only well-formed groups are unpacked, so "1,5" is not read as 15
+            grouped = values.str.match(_GROUPED_NUMBER).fillna(False).astype(bool)
+            numbers = values.where(~grouped, values.str.replace(',', '', regex=False))
+        converted = pd.to_numeric(numbers, errors='coerce')
+        if logical == "INTEGER":
+            fractional = present & ((converted % 1 != 0) | (converted.abs() >= 2 ** 63))
+            if fractional.any():
+                raise TypeMismatch({name: raw[fractional]})
+    else:
+        parsed = _parse_datetimes(values, column_type.date_format)
+        if logical == "DATE":
+            with_time = present & (parsed != parsed.dt.normalize())
+            if with_time.any():
+                raise TypeMismatch({name: raw[with_time]})
+        converted = parsed.dt.strftime(DATE_OUTPUT_FORMAT if logical == "DATE" else TIMESTAMP_OUTPUT_FORMAT)
+
+    unconverted = present & converted.isna()
+    if unconverted.any():
+        raise TypeMismatch({name: raw[unconverted]})
+    if logical in ("INTEGER", "BOOLEAN"):
+        return converted.astype("Int64")
+    if logical == "REAL":
+        return converted.astype("float64")
+    return converted
+
+# Convert a chunk read with dtype=str to the inferred column types; a TypeMismatch names
+# every column of the chunk with values that do not fit
+def convert_chunk(chunk, column_types):
+    converted = {}
+    mismatched = {}
+    for column in chunk.columns:
+        try:
+            converted[column] = _convert_column(column, chunk[column], column_types[column])
+        except TypeMismatch as e:
+            mismatched.update(e.values)
+    if mismatched:
+        raise TypeMismatch(mismatched)
+    return pd.DataFrame(converted, index=chunk.index)
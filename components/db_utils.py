@@ -1,88 +1,974 @@
 import pandas as pd
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
 import os
+import queue
+import re
+import shutil
 import sqlite3
 import tempfile
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+import dataclasses
+from dataclasses import dataclass
 from pathlib import Path
 
-# Function to create SQLite database from CSV files
-def create_db_from_csvs(uploaded_files, data_dir):
-    # Create a unique database name
-    db_name = f"user_data_{uuid.uuid4().hex[:8]}.db"
-    db_path = data_dir / db_name
-    
-    # Connect to SQLite database
-    conn = sqlite3.connect(db_path)
-    
-    # Dictionary to store table schemas
-    schemas = {}
-    # Dictionary to store dataframes
-    dataframes = {}
-    # Lists to track file names
-    csv_files = []
-    
-    # Process each uploaded file
-    for uploaded_file in uploaded_files:
-        # Get file name
-        file_name = uploaded_file.name
-        csv_files.append(file_name)
-        
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-            # Write the uploaded file content to the temporary file
-            tmp_file.write(uploaded_file.getvalue())
-            file_path = tmp_file.name
-        
-        # Read CSV file
-        df = pd.read_csv(file_path)
-        
-        # Clean table name (remove extension and special characters)
-        table_name = os.path.splitext(file_name)[0]
-        table_name = ''.join(c if c.isalnum() else '_' for c in table_name)
-        
-        # Store dataframe for preview
-        dataframes[table_name] = df
-        
-        # Write DataFrame to SQLite
-        df.to_sql(table_name, conn, index=False, if_exists='replace')
-        
-        # Generate schema information for this table
-        column_info = []
-        for column in df.columns:
-            dtype = str(df[column].dtype)
-            if "int" in dtype:
-                col_type = "INTEGER"
-            elif "float" in dtype:
-                col_type = "REAL"
-            elif "datetime" in dtype:
-                col_type = "TIMESTAMP"
-            else:
-                col_type = "TEXT"
-            column_info.append(f"{column} ({col_type})")
-        
-        # Store schema
-        schemas[table_name] = column_info
-        
-        # Clean up the temporary file
-        os.unlink(file_path)
-    
-    conn.close()
-    
-    # Format schema string for the LLM
-    schema_str = ""
-    for table, columns in schemas.items():
-        schema_str += f"Table: {table}\n"
-        schema_str += f"Columns: {', '.join(columns)}\n\n"
-    
-    return str(db_path), schema_str, dataframes
-
-# Function to execute SQL and return results
-def execute_sql(db_path, sql_query):
-    conn = sqlite3.connect(db_path)
+from components.csv_types import STORAGE_TYPES, ColumnType, TypeMismatch, convert_chunk, infer_column_types
+from components.profiling import ColumnProfiler, delete_profiles, read_profiles, read_sketches, write_profiles
+from components.schema_index import SchemaIndex, format_schema
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # files are parsed with the pandas C parser instead
+    pa = None
+    pa_csv = None
+
+# Rows read per chunk when streaming a CSV upload into SQLite
+STREAMING_CHUNK_ROWS = 50_000
+# Uploads larger than this are streamed in chunks instead of loaded whole
+STREAMING_THRESHOLD_BYTES = 64 * 1024 * 1024
+# Parse worker processes used when several files are uploaded at once
+MAX_INGEST_WORKERS = 8
+# Below this many bytes in total, files are parsed on one thread (starting processes costs more)
+PARALLEL_INGEST_MIN_BYTES = 16 * 1024 * 1024
+# Parsed batches waiting for the writer before parsers block
+INGEST_QUEUE_BATCHES = 8
+# How often the writer checks for parsers that died while waiting on the queue
+INGEST_POLL_SECONDS = 1.0
+# Bytes read at a time when hashing uploads
+HASH_BLOCK_BYTES = 1024 * 1024
+# Table holding dataset metadata inside each generated database
+META_TABLE = "_text2sql_meta"
+# Table where the index advisor records the indexes it created (see index_advisor)
+INDEX_TABLE = "_text2sql_indexes"
+# Most recently used earlier databases considered as the starting point of an incremental refresh
+MAX_REFRESH_CANDIDATES = 8
+# Bumped when the database layout changes so older files are rebuilt instead of reused
+DB_FORMAT_VERSION = "3"
+# STRICT tables (SQLite 3.37+) reject values that do not match the declared column type
+STRICT_TABLES = sqlite3.sqlite_version_info >= (3, 37, 0)
+# Row and time limits for trial runs of candidate queries
+DRY_RUN_MAX_ROWS = 100
+DRY_RUN_SECONDS = 5.0
+# SQLite virtual machine instructions between time budget checks
+PROGRESS_HANDLER_STEPS = 10_000
+
+# Clean table name (remove extension and special characters)
+def _clean_table_name(file_name):
+    table_name = os.path.splitext(os.path.basename(file_name))[0]
+    return ''.join(c if c.isalnum() else '_' for c in table_name)
+
+# Quote a table or column name for use in SQL
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+# Size of an upload in bytes without reading it
+def _upload_size(uploaded_file):
+    size = getattr(uploaded_file, 'size', None)
+    if size is None:
+        position = uploaded_file.tell()
+        size = uploaded_file.seek(0, os.SEEK_END)
+        uploaded_file.seek(position)
+    return size
+
+# Tables created by the app for its own bookkeeping
+def is_internal_table(table_name):
+    return table_name.startswith("_text2sql_")
+
+# Fingerprint of one upload, read once in blocks: its size, the hash of its file name plus bytes,
+# whether it ends with a newline, and the hash of its first n bytes for each n in prefix_sizes
+def _fingerprint_upload(uploaded_file, prefix_sizes=()):
+    digest = hashlib.sha256()
+    digest.update(os.path.basename(uploaded_file.name).encode('utf-8'))
+    digest.update(b'\0')
+    pending = sorted(size for size in set(prefix_sizes) if size > 0)
+    prefixes = {}
+    size = 0
+    last_byte = b''
+    uploaded_file.seek(0)
+    while True:
+        block = uploaded_file.read(HASH_BLOCK_BYTES)
+        if not block:
+            break
+        while pending and pending[0] <= size + len(block):
+            prefix = digest.copy()
+            prefix.update(block[:pending[0] - size])
+            prefixes[pending.pop(0)] = prefix.hexdigest()
+        digest.update(block)
+        size += len(block)
+        last_byte = block[-1:]
+    uploaded_file.seek(0)
+    return {"size": size, "digest": digest.hexdigest(), "ends_with_newline": last_byte == b'\n',
+            "prefixes": prefixes}
+
+def _dataset_digest(fingerprints):
+    # The same set of files hashes the same regardless of upload order
+    dataset_digest = hashlib.sha256()
+    for file_digest in sorted(fingerprint["digest"] for fingerprint in fingerprints):
+        dataset_digest.update(file_digest.encode('ascii'))
+    return dataset_digest.hexdigest()
+
+# Content hash of a set of uploads (file name plus bytes, read in blocks)
+def hash_uploads(uploaded_files):
+    return _dataset_digest([_fingerprint_upload(uploaded_file) for uploaded_file in uploaded_files])
+
+def _write_meta(conn, values):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)", values.items())
+
+# Read a metadata value stored by create_db_from_csvs, or None if missing
+def read_db_meta(db_path, key):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+# User tables of a database in the order they were created
+def list_user_tables(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
     try:
-        df = pd.read_sql_query(sql_query, conn)
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid")]
+    finally:
         conn.close()
-        return df
+    return [table_name for table_name in tables if not is_internal_table(table_name)]
+
+# Reopen a database that was already built from the same uploads
+def _load_existing_db(db_path):
+    schema_str = read_db_meta(db_path, 'schema')
+    if schema_str is None or read_db_meta(db_path, 'format_version') != DB_FORMAT_VERSION:
+        return None
+    return schema_str, list_user_tables(db_path)
+
+# Trade durability for speed while loading a freshly created database
+def _apply_bulk_load_pragmas(conn):
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+
+# Convert a DataFrame chunk into plain Python rows for executemany
+def _chunk_rows(chunk):
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+# Parse a whole CSV file as text with pyarrow, named the same way pandas names the columns
+def _read_csv_text_pyarrow(f):
+    # Every column is read as a string: pandas' pyarrow engine would infer numbers first and lose
+    # leading zeros, and types are inferred from the text afterwards anyway
+    columns = pd.read_csv(f, nrows=0).columns
+    f.seek(0)
+    placeholders = [f"c{position}" for position in range(len(columns))]
+    table = pa_csv.read_csv(
+        f,
+        read_options=pa_csv.ReadOptions(skip_rows=1, column_names=placeholders),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in placeholders}, strings_can_be_null=True
+        )
+    )
+    df = table.to_pandas()
+    df.columns = columns
+    return df
+
+# Read a CSV file as raw text (chunk, fraction of the file read) pairs
+def _read_csv_chunks(f, stream_file, chunksize):
+    total_bytes = max(f.seek(0, os.SEEK_END), 1)
+    f.seek(0)
+    if stream_file:
+        # Large files are read in bounded chunks
+        for chunk in pd.read_csv(f, dtype=str, chunksize=chunksize):
+            yield chunk, min(f.tell() / total_bytes, 1.0)
+        return
+
+    # Smaller files are parsed whole (multithreaded with pyarrow) and handed over in slices
+    df = None
+    if pa_csv is not None:
+        try:
+            df = _read_csv_text_pyarrow(f)
+        except pa.ArrowInvalid:
+            # The pyarrow parser is stricter than the C parser (e.g. about ragged rows)
+            f.seek(0)
+    if df is None:
+        df = pd.read_csv(f, dtype=str)
+    for start in range(0, max(len(df), 1), chunksize):
+        yield df.iloc[start:start + chunksize], min((start + chunksize) / max(len(df), 1), 1.0)
+
+class _UploadReader(io.RawIOBase):
+    """Binary reader over an upload's own buffer; pandas may close it without closing the upload"""
+
+    def __init__(self, uploaded_file):
+        self._file = uploaded_file
+        uploaded_file.seek(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        data = self._file.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+# Open a CSV source: a path (worker processes) or the upload itself (parser thread)
+def _open_source(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    return _UploadReader(source)
+
+# Parse, type and profile one CSV file, putting its batches on a queue for the writer.
+# Messages: ("batch", index, column_types, chunk, fraction), ("restart", index),
+# ("done", index, profiler, {column: ColumnType}) and ("error", index, exception)
+def _parse_csv_file(out_queue, index, source, stream_file, chunksize):
+    try:
+        inferred = None
+        while True:
+            column_types = None
+            profiler = None
+            try:
+                with _open_source(source) as f:
+                    for raw, fraction in _read_csv_chunks(f, stream_file, chunksize):
+                        if inferred is None:
+                            # Column types are inferred from the first chunk of raw text
+                            inferred = infer_column_types(raw)
+                        chunk = convert_chunk(raw, inferred)
+                        if column_types is None:
+                            column_types = [(column, inferred[column].logical) for column in chunk.columns]
+                            profiler = ColumnProfiler(column_types)
+                        profiler.update(chunk)
+                        out_queue.put(("batch", index, column_types, chunk, fraction))
+                break
+            except TypeMismatch as e:
+                # Later rows do not fit the sampled types: widen each such column straight to a type
+                # its values fit and load the file again
+                for column, values in e.values.items():
+                    inferred[column] = inferred[column].widened_for(values)
+                out_queue.put(("restart", index))
+
+        if column_types is None:
+            # A header-only file yields no chunks; still create its (empty) table
+            with _open_source(source) as f:
+                chunk = pd.read_csv(f, dtype=str, nrows=0)
+            column_types = [(column, "TEXT") for column in chunk.columns]
+            profiler = ColumnProfiler(column_types)
+            out_queue.put(("batch", index, column_types, chunk, 1.0))
+        out_queue.put(("done", index, profiler, inferred or {}))
     except Exception as e:
+        out_queue.put(("error", index, e))
+
+# Queue shared with the parse workers, set when each worker process starts
+_worker_queue = None
+
+def _init_ingest_worker(out_queue):
+    global _worker_queue
+    _worker_queue = out_queue
+
+def _parse_in_worker(index, file_path, stream_file, chunksize):
+    _parse_csv_file(_worker_queue, index, file_path, stream_file, chunksize)
+
+# Path of an upload on disk, spooling in-memory uploads to a temporary file so worker processes can open them
+def _upload_path(uploaded_file, tmp_dir):
+    try:
+        uploaded_file.fileno()
+        return uploaded_file.name
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv', dir=tmp_dir) as tmp_file:
+        uploaded_file.seek(0)
+        shutil.copyfileobj(uploaded_file, tmp_file)
+    uploaded_file.seek(0)
+    return tmp_file.name
+
+# Unblock parsers stuck on a full queue after the writer stopped early, until they have all returned
+def _drain_parsers(out_queue, futures):
+    while not all(future.done() for future in futures):
+        try:
+            out_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    while True:
+        try:
+            out_queue.get_nowait()
+        except queue.Empty:
+            break
+
+# Start parsing every file, in worker processes when there is enough work to pay for them.
+# Worker processes need the files on disk, so only then are in-memory uploads spooled to tmp_parent;
+# the parser thread reads each upload from its own buffer.
+def _start_parsers(jobs, chunksize, stack, tmp_parent=None):
+    total_bytes = sum(size for _, _, _, size in jobs)
+    workers = min(len(jobs), os.cpu_count() or 1, MAX_INGEST_WORKERS)
+    if workers > 1 and total_bytes >= PARALLEL_INGEST_MIN_BYTES:
+        tmp_dir = stack.enter_context(tempfile.TemporaryDirectory(dir=tmp_parent))
+        jobs = [(index, _upload_path(uploaded_file, tmp_dir), stream_file, size)
+                for index, uploaded_file, stream_file, size in jobs]
+        # spawn avoids forking a process that is running Streamlit's threads
+        context = multiprocessing.get_context("spawn")
+        out_queue = context.Queue(maxsize=INGEST_QUEUE_BATCHES)
+        executor = stack.enter_context(ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_ingest_worker, initargs=(out_queue,)
+        ))
+        futures = [executor.submit(_parse_in_worker, index, path, stream_file, chunksize)
+                   for index, path, stream_file, _ in jobs]
+    else:
+        out_queue = queue.Queue(maxsize=INGEST_QUEUE_BATCHES)
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-parse"))
+        futures = [executor.submit(_parse_csv_file, out_queue, index, uploaded_file, stream_file, chunksize)
+                   for index, uploaded_file, stream_file, _ in jobs]
+
+    # On exit: cancel files not started yet, then drain so running parsers can finish
+    stack.callback(_drain_parsers, out_queue, futures)
+    stack.callback(executor.shutdown, wait=False, cancel_futures=True)
+    return out_queue, futures
+
+# Later uploads replace earlier ones that map to the same table name
+def _uploads_by_table(uploaded_files):
+    by_table = {}
+    for uploaded_file in uploaded_files:
+        by_table[_clean_table_name(uploaded_file.name)] = uploaded_file
+    return by_table
+
+# Parse and insert whole files into tables (replacing existing ones) inside the caller's transaction.
+# Returns ({table: column_types}, {table: ColumnProfiler}, {table: {column: ColumnType}})
+def _load_files(conn, by_table, db_file, streaming, chunksize, progress=None):
+    table_names = list(by_table)
+    files = list(by_table.values())
+    schemas = {}
+    # Column profiles computed by the parsers so previews never recompute them
+    profiles = {}
+    column_types_by_table = {}
+    if not files:
+        return schemas, profiles, column_types_by_table
+
+    with ExitStack() as stack:
+        jobs = []
+        for index, uploaded_file in enumerate(files):
+            size = _upload_size(uploaded_file)
+            # Large uploads are read in chunks instead of parsed whole
+            stream_file = streaming if streaming is not None else size > STREAMING_THRESHOLD_BYTES
+            jobs.append((index, uploaded_file, stream_file, size))
+        out_queue, futures = _start_parsers(jobs, chunksize, stack, os.path.dirname(db_file) or None)
+
+        # Single writer: batches from all parsers are inserted here
+        insert_sql = {}
+        rows_loaded = [0] * len(files)
+        remaining = len(files)
+        while remaining:
+            try:
+                message = out_queue.get(timeout=INGEST_POLL_SECONDS)
+            except queue.Empty:
+                # A parser that died without reporting (e.g. a killed process) would block forever
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                continue
+
+            kind, index = message[0], message[1]
+            table_name = table_names[index]
+            if kind == "error":
+                raise message[2]
+            if kind == "restart":
+                # The parser widened a column type; drop what was written so far
+                if index in insert_sql:
+                    conn.execute(f"DROP TABLE {quote_identifier(table_name)}")
+                    del insert_sql[index]
+                rows_loaded[index] = 0
+                continue
+            if kind == "done":
+                profiles[table_name] = message[2]
+                column_types_by_table[table_name] = message[3]
+                remaining -= 1
+                if progress is not None:
+                    progress(files[index].name, 1.0, rows_loaded[index])
+                continue
+
+            _, _, column_types, chunk, fraction = message
+            if index not in insert_sql:
+                columns_sql = ', '.join(f"{quote_identifier(c)} {STORAGE_TYPES[t]}" for c, t in column_types)
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+                conn.execute(f"CREATE TABLE {quote_identifier(table_name)} ({columns_sql})"
+                             f"{' STRICT' if STRICT_TABLES else ''}")
+                placeholders = ', '.join('?' for _ in column_types)
+                insert_sql[index] = f"INSERT INTO {quote_identifier(table_name)} VALUES ({placeholders})"
+                schemas[table_name] = column_types
+            conn.executemany(insert_sql[index], _chunk_rows(chunk))
+            rows_loaded[index] += len(chunk)
+            if progress is not None:
+                progress(files[index].name, fraction, rows_loaded[index])
+    return schemas, profiles, column_types_by_table
+
+# Insert the rows a file gained since it was loaded, typed as the table was, and extend its profile.
+# Raises TypeMismatch or ValueError (e.g. a parse error) when the new rows do not fit the table.
+def _append_tail(conn, table_name, uploaded_file, source, column_types, profiler, chunksize):
+    types = {column: ColumnType(*source["types"].get(column, ("TEXT", False, None))) for column, _ in column_types}
+    placeholders = ', '.join('?' for _ in column_types)
+    insert_sql = f"INSERT INTO {quote_identifier(table_name)} VALUES ({placeholders})"
+    rows_added = 0
+    # The new rows start right after the bytes that were loaded before, with no header of their own.
+    # They are copied out first because pandas closes the file it reads from.
+    with tempfile.SpooledTemporaryFile(max_size=STREAMING_THRESHOLD_BYTES) as tail:
+        uploaded_file.seek(source["size"])
+        shutil.copyfileobj(uploaded_file, tail)
+        uploaded_file.seek(0)
+        tail.seek(0)
+        try:
+            for raw in pd.read_csv(tail, header=None, names=[column for column, _ in column_types],
+                                   index_col=False, dtype=str, chunksize=chunksize):
+                chunk = convert_chunk(raw, types)
+                profiler.update(chunk)
+                conn.executemany(insert_sql, _chunk_rows(chunk))
+                rows_added += len(chunk)
+        except pd.errors.EmptyDataError:
+            # Only blank lines were added
+            pass
+    return rows_added
+
+# Definitions of the indexes on a table, so they can be created again after it is reloaded
+def _table_indexes(conn, table_name):
+    return [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table_name,))]
+
+@dataclass
+class RefreshBase:
+    """An earlier database that a refresh starts from, and what happens to each uploaded table"""
+    db_path: str
+    # Source fingerprints stored in the earlier database, per table
+    sources: dict
+    # "keep" an identical file, "append" the new tail of a file that grew, or "load" it again
+    actions: dict
+
+# Load every upload into a new SQLite file and return its schema string and table names.
+# With a base, db_file starts as a copy of the base database and only changed tables are loaded.
+def _build_db(by_table, db_file, fingerprints, dataset_digest, streaming, chunksize, progress=None, base=None):
+    # Connect to SQLite database (autocommit so the load controls its own transaction)
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    _apply_bulk_load_pragmas(conn)
+
+    table_names = list(by_table)
+    schemas = {}
+    profiles = {}
+    # What each table was built from, so a later refresh can tell which files changed
+    sources = {}
+    actions = {table_name: "load" for table_name in table_names}
+    previous = None
+
+    try:
+        conn.execute("BEGIN")
+        if base is not None:
+            previous = SchemaIndex.from_json(read_db_meta(base.db_path, 'schema_index'))
+            # Tables whose file is no longer uploaded
+            removed = [table for table in previous.tables if table not in by_table]
+            for table in removed:
+                conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+            delete_profiles(conn, removed)
+
+            for table_name in table_names:
+                action = base.actions[table_name]
+                if action == "keep":
+                    schemas[table_name] = previous.tables[table_name]
+                    sources[table_name] = base.sources[table_name]
+                    actions[table_name] = "keep"
+                    if progress is not None:
+                        progress(by_table[table_name].name, 1.0, TableHandle(base.db_path, table_name).row_count)
+                    continue
+                if action != "append":
+                    continue
+                column_types = previous.tables[table_name]
+                conn.execute("SAVEPOINT append_tail")
+                try:
+                    profiler = ColumnProfiler.resume(
+                        column_types, read_profiles(base.db_path, table_name).get(table_name, pd.DataFrame()),
+                        read_sketches(base.db_path, table_name)
+                    )
+                    rows_added = _append_tail(conn, table_name, by_table[table_name], base.sources[table_name],
+                                              column_types, profiler, chunksize)
+                except (TypeMismatch, ValueError, KeyError):
+                    # The new rows do not fit the table as it was typed; load the whole file again
+                    conn.execute("ROLLBACK TO append_tail")
+                    conn.execute("RELEASE append_tail")
+                    continue
+                conn.execute("RELEASE append_tail")
+                schemas[table_name] = column_types
+                profiles[table_name] = profiler
+                sources[table_name] = dict(base.sources[table_name], size=fingerprints[table_name]["size"],
+                                           digest=fingerprints[table_name]["digest"],
+                                           ends_with_newline=fingerprints[table_name]["ends_with_newline"])
+                actions[table_name] = "append"
+                if progress is not None:
+                    progress(by_table[table_name].name, 1.0, rows_added)
+
+        to_load = {table_name: by_table[table_name] for table_name in table_names if actions[table_name] == "load"}
+        # Indexes on tables that are loaded again (added by the index advisor) are rebuilt afterwards
+        indexes = [sql for table_name in to_load for sql in _table_indexes(conn, table_name)]
+        loaded_schemas, loaded_profiles, loaded_types = _load_files(conn, to_load, db_file, streaming, chunksize,
+                                                                    progress)
+        schemas.update(loaded_schemas)
+        profiles.update(loaded_profiles)
+        for table_name, column_types in loaded_types.items():
+            sources[table_name] = {
+                "size": fingerprints[table_name]["size"],
+                "digest": fingerprints[table_name]["digest"],
+                "ends_with_newline": fingerprints[table_name]["ends_with_newline"],
+                "types": {column: list(dataclasses.astuple(column_type))
+                          for column, column_type in column_types.items()}
+            }
+        for sql in indexes:
+            try:
+                conn.execute(sql)
+            except sqlite3.OperationalError:
+                # An indexed column is gone from the new file
+                pass
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (INDEX_TABLE,)).fetchone():
+            # Forget advised indexes that went with a removed table or could not be rebuilt
+            conn.execute(f"DELETE FROM {INDEX_TABLE} WHERE index_name NOT IN "
+                         "(SELECT name FROM sqlite_master WHERE type = 'index')")
+        conn.execute("COMMIT")
+
+        # Keep tables in upload order
+        schemas = {table_name: schemas[table_name] for table_name in table_names}
+
+        # Format schema string for the LLM
+        schema_str = format_schema(schemas)
+
+        # Index table names, columns and sampled values for schema selection (sampling only changed tables)
+        changed = {table_name for table_name in table_names if actions[table_name] != "keep"}
+        schema_index = SchemaIndex.build(conn, schemas, previous, changed)
+
+        # Record what the database was built from so it can be reused
+        conn.execute("BEGIN")
+        write_profiles(conn, profiles)
+        _write_meta(conn, {
+            'format_version': DB_FORMAT_VERSION,
+            'dataset_digest': dataset_digest,
+            'schema': schema_str,
+            'schema_index': schema_index.to_json(),
+            'table_sources': json.dumps(sources),
+            'table_actions': json.dumps(actions)
+        })
+        conn.execute("COMMIT")
+        # Write-ahead logging from here on, so the index advisor's writes never block
+        # sessions reading the database (and open readers never block the advisor)
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
         conn.close()
-        return str(e)
\ No newline at end of file
+
+    return schema_str, list(schemas)
+
+# Earlier databases in data_dir that a refresh could start from, most recently used first
+def _refresh_candidates(data_dir):
+    candidates = []
+    for path in Path(data_dir).glob("user_data_*.db"):
+        try:
+            candidates.append((path.stat().st_mtime, path))
+        except OSError:
+            continue
+    bases = {}
+    for _, path in sorted(candidates, reverse=True)[:MAX_REFRESH_CANDIDATES]:
+        if read_db_meta(path, 'format_version') != DB_FORMAT_VERSION:
+            continue
+        sources = read_db_meta(path, 'table_sources')
+        if sources:
+            bases[str(path)] = json.loads(sources)
+    return bases
+
+def _refresh_actions(fingerprints, sources):
+    actions = {}
+    for table_name, fingerprint in fingerprints.items():
+        source = sources.get(table_name)
+        if source is None:
+            actions[table_name] = "load"
+        elif source["digest"] == fingerprint["digest"]:
+            actions[table_name] = "keep"
+        elif source["ends_with_newline"] and fingerprint["prefixes"].get(source["size"]) == source["digest"]:
+            # The file starts with exactly the bytes loaded before: only rows were added at the end
+            actions[table_name] = "append"
+        else:
+            actions[table_name] = "load"
+    return actions
+
+# The earlier database that lets the most bytes of the uploads be reused, or None
+def _choose_refresh_base(fingerprints, candidates):
+    best, best_reused = None, 0
+    for db_path, sources in candidates.items():
+        actions = _refresh_actions(fingerprints, sources)
+        reused = sum(sources[table_name]["size"] for table_name, action in actions.items() if action != "load")
+        if reused > best_reused:
+            best, best_reused = RefreshBase(db_path, sources, actions), reused
+    return best
+
+# Copy a database page by page; a consistent snapshot even while the index advisor writes to it
+def _copy_db(source_path, target_path):
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+# Function to create SQLite database from CSV files
+# progress, if given, is called as progress(file_name, fraction_done, rows_loaded) while files load.
+# When an earlier database in data_dir was built from some of the same files, it is refreshed
+# incrementally: unchanged tables are kept, files that grew by appending rows only insert the new
+# rows, and only the remaining files are parsed again.
+def create_db_from_csvs(uploaded_files, data_dir, streaming=None, chunksize=STREAMING_CHUNK_ROWS, progress=None):
+    by_table = _uploads_by_table(uploaded_files)
+    candidates = _refresh_candidates(data_dir)
+    # Sizes at which each file is also hashed, to recognize earlier versions it was appended to
+    prefix_sizes = {table_name: [sources[table_name]["size"] for sources in candidates.values()
+                                 if table_name in sources]
+                    for table_name in by_table}
+    file_fingerprints = [_fingerprint_upload(uploaded_file, prefix_sizes[_clean_table_name(uploaded_file.name)])
+                         for uploaded_file in uploaded_files]
+    # As with the tables, a later upload's fingerprint wins
+    fingerprints = {_clean_table_name(uploaded_file.name): fingerprint
+                    for uploaded_file, fingerprint in zip(uploaded_files, file_fingerprints)}
+    # Name the database after the content of the uploads
+    dataset_digest = _dataset_digest(file_fingerprints)
+    db_name = f"user_data_{dataset_digest[:16]}.db"
+    db_path = data_dir / db_name
+
+    # Reuse the database if these exact files were already loaded
+    if db_path.exists():
+        existing = _load_existing_db(db_path)
+        if existing is not None:
+            schema_str, tables = existing
+            handles = {table: TableHandle(db_path, table) for table in tables}
+            if progress is not None:
+                for uploaded_file in uploaded_files:
+                    handle = handles.get(_clean_table_name(uploaded_file.name))
+                    progress(uploaded_file.name, 1.0, handle.row_count if handle is not None else 0)
+            return str(db_path), schema_str, handles
+
+    # Build into a temporary file so a half-written database is never reused
+    tmp_path = data_dir / f".{db_name}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        base = _choose_refresh_base(fingerprints, candidates)
+        if base is not None:
+            _copy_db(base.db_path, tmp_path)
+        schema_str, tables = _build_db(by_table, tmp_path, fingerprints, dataset_digest, streaming, chunksize,
+                                       progress, base)
+        os.replace(tmp_path, db_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    # Callers get lightweight handles; rows stay in SQLite until a preview asks for them
+    return str(db_path), schema_str, {table: TableHandle(db_path, table) for table in tables}
+
+# Read-only connections kept open per database
+POOL_SIZE = 4
+# Databases with open connection pools before the least recently used one is closed
+MAX_POOLS = 16
+# How long a borrower waits for a pooled connection before using a connection of its own
+POOL_WAIT_SECONDS = 10.0
+# Memory-map up to this much of each database file for reads
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+# Page cache per pooled connection, in KiB
+CACHE_SIZE_KIB = 64 * 1024
+# Default per-query limits applied by execute_sql
+QUERY_TIME_BUDGET_SECONDS = 30.0
+QUERY_MAX_ROWS = 200_000
+QUERY_MAX_BYTES = 256 * 1024 * 1024
+# Rows fetched from the cursor at a time
+FETCH_BATCH_ROWS = 5_000
+
+# Open a tuned read-only connection that may be used from any thread (one at a time)
+def connect_read_only(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+class ConnectionPool:
+    """Thread-safe pool of read-only connections to one SQLite database.
+
+    Borrowers that find every connection in use wait up to POOL_WAIT_SECONDS, then open an
+    unpooled connection (closed after use) rather than hang on a leaked connection. Once the
+    pool is closed (e.g. evicted past MAX_POOLS), waiters are woken and every borrower gets an
+    unpooled connection.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = str(db_path)
+        self.size = size
+        # Idle connections; None is put here to wake a waiter when the pool closes
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._waiting = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    # A pooled connection, or None when the borrower should open its own
+    def _borrow(self):
+        if self._closed:
+            return None
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+                self._waiting += 1
+        if open_new:
+            try:
+                return connect_read_only(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=POOL_WAIT_SECONDS)
+        except queue.Empty:
+            logger.warning("No pooled connection to %s within %.0fs; opening another", self.db_path,
+                           POOL_WAIT_SECONDS)
+            return None
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, opening a new one while the pool is below its size"""
+        conn = self._borrow()
+        pooled = conn is not None
+        if not pooled:
+            conn = connect_read_only(self.db_path)
+
+        try:
+            yield conn
+        finally:
+            # Leave no per-query hooks behind for the next borrower
+            conn.set_progress_handler(None, 0)
+            conn.set_authorizer(None)
+            if pooled and not self._closed:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if conn is not None:
+                conn.close()
+        # Wake borrowers waiting for a connection; they open their own instead
+        with self._lock:
+            waiting = self._waiting
+        for _ in range(waiting):
+            self._idle.put(None)
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+# Get the shared read-only connection pool for a database
+def get_connection_pool(db_path):
+    db_path = str(db_path)
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+            if len(_pools) > MAX_POOLS:
+                _, evicted = _pools.popitem(last=False)
+                evicted.close()
+        else:
+            _pools.move_to_end(db_path)
+        return pool
+
+@dataclass
+class QueryResult:
+    """Rows returned by execute_sql plus whether a limit stopped the query early"""
+    dataframe: pd.DataFrame
+    elapsed: float
+    # A row or byte cap was reached and the remaining rows were not fetched
+    truncated: bool = False
+    # The time budget ran out and the query was interrupted
+    cancelled: bool = False
+    reason: str = ""
+
+    @property
+    def row_count(self):
+        return len(self.dataframe)
+
+class TableHandle:
+    """Lazy view of one loaded table: rows and statistics are read from SQLite on demand"""
+
+    def __init__(self, db_path, table_name):
+        self.db_path = str(db_path)
+        self.table_name = table_name
+
+    def head(self, n=10):
+        """First n rows via a LIMIT query"""
+        with get_connection_pool(self.db_path).connection() as conn:
+            return pd.read_sql_query(
+                f"SELECT * FROM {quote_identifier(self.table_name)} LIMIT ?", conn, params=(int(n),))
+
+    def profile(self):
+        """Column profiles stored at ingest (empty DataFrame if none were stored)"""
+        return read_profiles(self.db_path, self.table_name).get(self.table_name, pd.DataFrame())
+
+    @property
+    def columns(self):
+        with get_connection_pool(self.db_path).connection() as conn:
+            return [row[1] for row in conn.execute("SELECT * FROM pragma_table_info(?)", (self.table_name,))]
+
+    @property
+    def row_count(self):
+        profile = self.profile()
+        if not profile.empty:
+            return int(profile["row_count"].iloc[0])
+        with get_connection_pool(self.db_path).connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(self.table_name)}").fetchone()[0]
+
+    def __repr__(self):
+        return f"TableHandle({self.db_path!r}, {self.table_name!r})"
+
+# Rough in-memory size of a fetched row
+def estimate_row_bytes(row):
+    return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row)
+
+# Fetch from an executed cursor (sqlite3 or DB-API alike) into rows, stopping at the row or byte cap.
+# Returns (rows, reason); reason is empty unless a cap was reached. Rows fetched so far are kept
+# in the rows list passed in, so a caller interrupted mid-fetch still has them.
+def fetch_limited(cursor, rows, max_rows=QUERY_MAX_ROWS, max_bytes=QUERY_MAX_BYTES):
+    size = 0
+    while True:
+        batch = cursor.fetchmany(min(FETCH_BATCH_ROWS, max_rows - len(rows) + 1))
+        if not batch:
+            return rows, ""
+        for row in batch:
+            if len(rows) >= max_rows:
+                return rows, f"Stopped at the {max_rows:,} row limit"
+            size += estimate_row_bytes(row)
+            if size > max_bytes:
+                return rows, f"Stopped at the {max_bytes / (1024 * 1024):g} MB size limit after {len(rows):,} rows"
+            rows.append(row)
+
+# Function to execute SQL and return results (a QueryResult, or an error string)
+def execute_sql(db_path, sql_query, time_budget=QUERY_TIME_BUDGET_SECONDS,
+                max_rows=QUERY_MAX_ROWS, max_bytes=QUERY_MAX_BYTES):
+    started = time.monotonic()
+    deadline = started + time_budget
+    rows = []
+    columns = []
+    truncated = False
+    cancelled = False
+    reason = ""
+
+    with get_connection_pool(db_path).connection() as conn:
+        # A non-zero return from the handler interrupts the running statement
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_HANDLER_STEPS)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql_query)
+            columns = [column[0] for column in cursor.description or []]
+            rows, reason = fetch_limited(cursor, rows, max_rows, max_bytes)
+            truncated = bool(reason)
+        except sqlite3.OperationalError as e:
+            if time.monotonic() <= deadline:
+                return str(e)
+            cancelled = True
+            reason = f"Cancelled after {time_budget:g} seconds with {len(rows):,} rows fetched"
+        except Exception as e:
+            return str(e)
+        finally:
+            # Finalize the statement so the pooled connection holds no read lock
+            cursor.close()
+
+    return QueryResult(
+        dataframe=pd.DataFrame.from_records(rows, columns=columns),
+        elapsed=time.monotonic() - started,
+        truncated=truncated,
+        cancelled=cancelled,
+        reason=reason
+    )
+
+# Authorizer actions a read-only query may need while it is being compiled
+_READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    if action in _READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    # Table-valued pragma functions such as pragma_table_info() touch the schema table
+    if action == sqlite3.SQLITE_UPDATE and arg1 in ("sqlite_master", "sqlite_temp_master"):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+# Strip leading comments so the first keyword of a statement can be checked
+def first_keyword(sql_query):
+    sql_query = re.sub(r'^(\s*(--[^\n]*\n|/\*.*?\*/))*\s*', '', sql_query, flags=re.DOTALL)
+    match = re.match(r'[A-Za-z]+', sql_query)
+    return match.group(0).upper() if match else ""
+
+# Compile SQL against the database without running it; returns an error message or None
+def check_sql(db_path, sql_query):
+    if not sql_query or not sql_query.strip():
+        return "No SQL query was produced."
+
+    if re.search(r'\bFROM\s+PRAGMA\b', sql_query, re.IGNORECASE):
+        return ("PRAGMA statements are not tables and cannot be used in FROM clauses. "
+                "Use the table-valued function instead, e.g. SELECT * FROM pragma_table_info('tablename').")
+
+    if first_keyword(sql_query) not in ("SELECT", "WITH"):
+        return "Only read-only SELECT or WITH queries are allowed."
+
+    with get_connection_pool(db_path).connection() as conn:
+        try:
+            conn.set_authorizer(_read_only_authorizer)
+            # EXPLAIN prepares the statement (resolving tables, columns and functions) without executing it
+            conn.execute(f"EXPLAIN {sql_query}")
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            if "not authorized" in str(e):
+                return "Only read-only SELECT or WITH queries are allowed."
+            return f"SQLite error: {e}"
+    return None
+
+# Run a query on a read-only connection with a row cap and time budget; returns an error message or None
+def dry_run_sql(db_path, sql_query, max_rows=DRY_RUN_MAX_ROWS, time_budget=DRY_RUN_SECONDS):
+    error = check_sql(db_path, sql_query)
+    if error is not None:
+        return error
+
+    # A run cut short by the time budget compiled and hit no error, so it passes: slow is not wrong
+    result = execute_sql(db_path, sql_query, time_budget=time_budget, max_rows=max_rows)
+    if isinstance(result, str):
+        return f"SQLite error: {result}"
+    return None
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from components.db_utils import (
+    DRY_RUN_MAX_ROWS, DRY_RUN_SECONDS, PROGRESS_HANDLER_STEPS, QUERY_MAX_BYTES, QUERY_MAX_ROWS,
+    QUERY_TIME_BUDGET_SECONDS, QueryResult, first_keyword, quote_identifier, check_sql, connect_read_only,
+    execute_sql, fetch_limited, list_user_tables, read_db_meta
+)
+from components.result_cache import database_fingerprint
+from components.schema_index import SchemaIndex
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is optional; queries fall back to SQLite
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Query engines in order of preference for the UI; SQLite is always available
+ENGINES = ("sqlite", "duckdb")
+DEFAULT_ENGINE = "sqlite"
+# Name of each engine's SQL dialect in prompts and error messages
+ENGINE_DIALECTS = {"sqlite": "SQLite", "duckdb": "DuckDB"}
+# Errors raised by either engine's driver
+ENGINE_ERRORS = (sqlite3.Error,) + ((duckdb.Error,) if duckdb is not None else ())
+
+# Rows copied from SQLite into the columnar DuckDB file at a time
+DUCKDB_COPY_CHUNK_ROWS = 100_000
+# DuckDB databases kept open before the least recently used one is closed
+MAX_DUCKDB_CONNECTIONS = 16
+# Logical column types (see csv_types) as native DuckDB types
+DUCKDB_TYPES = {
+    "INTEGER": "BIGINT",
+    "REAL": "DOUBLE",
+    "TEXT": "VARCHAR",
+    "BOOLEAN": "BOOLEAN",
+    "DATE": "DATE",
+    "TIMESTAMP": "TIMESTAMP",
+}
+
+def available_engines():
+    return tuple(engine for engine in ENGINES if engine != "duckdb" or duckdb is not None)
+
+# The requested engine if it can be used here, otherwise SQLite
+def resolve_engine(engine):
+    return engine if engine in available_engines() else DEFAULT_ENGINE
+
+# Path of the DuckDB copy of a database's current content. It is named after the database's
+# fingerprint, so a SQLite file rebuilt at the same path (e.g. for a new format version) gets a new copy.
+def duckdb_path(db_path):
+    fingerprint = hashlib.sha256(database_fingerprint(db_path).encode('utf-8')).hexdigest()[:16]
+    return Path(db_path).with_suffix(f".{fingerprint}.duckdb")
+
+# Copies made for earlier content of the same database path (including unversioned ones)
+def _stale_duckdb_copies(db_path, current):
+    db_path = Path(db_path)
+    candidates = [db_path.with_suffix(".duckdb"), *db_path.parent.glob(f"{db_path.stem}.*.duckdb")]
+    return [path for path in candidates if path != current and path.exists()]
+
+# Logical column types recorded at ingest, or the SQLite storage types for older databases
+def _table_columns(db_path):
+    data = read_db_meta(db_path, 'schema_index')
+    if data:
+        return SchemaIndex.from_json(data).tables
+    conn = connect_read_only(db_path)
+    try:
+        return {
+            table: [(row[1], row[2]) for row in conn.execute("SELECT * FROM pragma_table_info(?)", (table,))]
+            for table in list_user_tables(db_path)
+        }
+    finally:
+        conn.close()
+
+def _copy_to_duckdb(db_path, target):
+    columns_by_table = _table_columns(db_path)
+    sqlite_conn = connect_read_only(db_path)
+    duck_conn = duckdb.connect(str(target))
+    try:
+        for table, columns in columns_by_table.items():
+            columns_sql = ', '.join(
+                f"{quote_identifier(column)} {DUCKDB_TYPES.get(col_type, 'VARCHAR')}" for column, col_type in columns
+            )
+            duck_conn.execute(f"CREATE TABLE {quote_identifier(table)} ({columns_sql})")
+            # Values arrive in their SQLite storage form (ISO text dates, 0/1 booleans) and are cast on insert
+            casts = ', '.join(
+                f"CAST({quote_identifier(column)} AS {DUCKDB_TYPES.get(col_type, 'VARCHAR')})"
+                for column, col_type in columns
+            )
+            for chunk in pd.read_sql_query(f"SELECT * FROM {quote_identifier(table)}", sqlite_conn,
+                                           chunksize=DUCKDB_COPY_CHUNK_ROWS):
+                duck_conn.register("sqlite_chunk", chunk)
+                duck_conn.execute(f"INSERT INTO {quote_identifier(table)} SELECT {casts} FROM sqlite_chunk")
+                duck_conn.unregister("sqlite_chunk")
+    finally:
+        duck_conn.close()
+        sqlite_conn.close()
+
+_copy_locks = {}
+_copy_locks_lock = threading.Lock()
+
+# Build the columnar DuckDB copy of an ingested database once per content; returns its path.
+# Copies of the database's earlier content are removed once the new one exists.
+def ensure_duckdb_copy(db_path):
+    if duckdb is None:
+        raise RuntimeError("DuckDB is not installed")
+    target = duckdb_path(db_path)
+    with _copy_locks_lock:
+        lock = _copy_locks.setdefault(str(target), threading.Lock())
+    with lock:
+        if target.exists():
+            return target
+        tmp_path = target.with_name(f"{target.name}.tmp")
+        for path in (tmp_path, tmp_path.with_name(f"{tmp_path.name}.wal")):
+            if path.exists():
+                path.unlink()
+        try:
+            _copy_to_duckdb(db_path, tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        for stale in _stale_duckdb_copies(db_path, target):
+            # Queries still running on a stale copy keep their connection until they finish
+            with _duckdb_connections_lock:
+                _duckdb_connections.pop(str(stale), None)
+            try:
+                stale.unlink()
+            except OSError as e:
+                logger.warning("Could not remove outdated DuckDB copy %s: %s", stale, e)
+    return target
+
+_duckdb_connections = OrderedDict()
+_duckdb_connections_lock = threading.Lock()
+
+# Shared read-only DuckDB connection for a database; callers take a .cursor() per query
+def _duckdb_connection(db_path):
+    target = str(ensure_duckdb_copy(db_path))
+    with _duckdb_connections_lock:
+        conn = _duckdb_connections.get(target)
+        if conn is None:
+            # Generated SQL must not reach files or other databases through DuckDB's table functions
+            conn = duckdb.connect(target, read_only=True,
+                                  config={"enable_external_access": False, "lock_configuration": True})
+            _duckdb_connections[target] = conn
+            if len(_duckdb_connections) > MAX_DUCKDB_CONNECTIONS:
+                _, evicted = _duckdb_connections.popitem(last=False)
+                evicted.close()
+        else:
+            _duckdb_connections.move_to_end(target)
+        return conn
+
+# Open a new read-only connection on the given engine (close it when done)
+def connect_engine(db_path, engine=DEFAULT_ENGINE):
+    if resolve_engine(engine) == "duckdb":
+        return _duckdb_connection(db_path).cursor()
+    return connect_read_only(db_path)
+
+# Interrupt the query running on a connection or cursor once the time budget is spent
+@contextmanager
+def time_limit(conn, seconds):
+    if isinstance(conn, sqlite3.Cursor):
+        conn = conn.connection
+    if isinstance(conn, sqlite3.Connection):
+        deadline = time.monotonic() + seconds
+        # A non-zero return from the handler interrupts the running statement
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_HANDLER_STEPS)
+        try:
+            yield
+        finally:
+            conn.set_progress_handler(None, 0)
+        return
+
+    timer = threading.Timer(seconds, conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        timer.cancel()
+
+# execute_sql on the chosen engine (a QueryResult, or an error string)
+def execute_query(db_path, sql_query, engine=DEFAULT_ENGINE, time_budget=QUERY_TIME_BUDGET_SECONDS,
+                  max_rows=QUERY_MAX_ROWS, max_bytes=QUERY_MAX_BYTES):
+    if resolve_engine(engine) == "sqlite":
+        return execute_sql(db_path, sql_query, time_budget=time_budget, max_rows=max_rows, max_bytes=max_bytes)
+
+    started = time.monotonic()
+    rows = []
+    columns = []
+    reason = ""
+    cancelled = False
+    try:
+        conn = connect_engine(db_path, engine)
+    except Exception as e:
+        return str(e)
+    try:
+        with time_limit(conn, time_budget):
+            conn.execute(sql_query)
+            columns = [column[0] for column in conn.description or []]
+            rows, reason = fetch_limited(conn, rows, max_rows, max_bytes)
+    except duckdb.InterruptException:
+        cancelled = True
+        reason = f"Cancelled after {time_budget:g} seconds with {len(rows):,} rows fetched"
+    except Exception as e:
+        return str(e)
+    finally:
+        conn.close()
+
+    return QueryResult(
+        dataframe=pd.DataFrame.from_records(rows, columns=columns),
+        elapsed=time.monotonic() - started,
+        truncated=bool(reason) and not cancelled,
+        cancelled=cancelled,
+        reason=reason
+    )
+
+# check_sql on the chosen engine: compile without running; returns an error message or None
+def check_query(db_path, sql_query, engine=DEFAULT_ENGINE):
+    if resolve_engine(engine) == "sqlite":
+        return check_sql(db_path, sql_query)
+
+    if not sql_query or not sql_query.strip():
+        return "No SQL query was produced."
+    if first_keyword(sql_query) not in ("SELECT", "WITH"):
+        return "Only read-only SELECT or WITH queries are allowed."
+    try:
+        conn = connect_engine(db_path, engine)
+    except Exception as e:
+        return f"DuckDB error: {e}"
+    try:
+        # EXPLAIN binds tables, columns and functions without executing the query
+        conn.execute(f"EXPLAIN {sql_query}")
+    except duckdb.Error as e:
+        return f"DuckDB error: {e}"
+    finally:
+        conn.close()
+    return None
+
+# dry_run_sql on the chosen engine; returns an error message or None
+def dry_run_query(db_path, sql_query, engine=DEFAULT_ENGINE, max_rows=DRY_RUN_MAX_ROWS,
+                  time_budget=DRY_RUN_SECONDS):
+    error = check_query(db_path, sql_query, engine)
+    if error is not None:
+        return error
+
+    # As with dry_run_sql, a run cut short by the time budget passes
+    result = execute_query(db_path, sql_query, engine, time_budget=time_budget, max_rows=max_rows)
+    if isinstance(result, str):
+        return f"{ENGINE_DIALECTS[resolve_engine(engine)]} error: {result}"
+    return None
@@ -0,0 +1,299 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from components.db_utils import INDEX_TABLE, QueryResult, quote_identifier, execute_sql
+
+logger = logging.getLogger(__name__)
+
+# Disk the advisor may spend on indexes, as a fraction of the database size (with a floor)
+INDEX_DISK_BUDGET_FRACTION = 0.25
+INDEX_DISK_BUDGET_MIN_BYTES = 16 * 1024 * 1024
+# Key columns per index, and total columns before an index stops being made covering
+MAX_KEY_COLUMNS = 3
+MAX_COVERING_COLUMNS = 6
+# Indexes that do not make the query at least this much faster are dropped again
+MIN_SPEEDUP = 1.2
+# Limits for the before/after timing runs
+TIMING_BUDGET_SECONDS = 30.0
+TIMING_MAX_ROWS = 10_000
+# How long the advisor waits for a lock on the database before giving up for now
+INDEX_LOCK_TIMEOUT_SECONDS = 1.0
+# Advice that found the database locked is tried again after this long, up to a few times
+INDEX_RETRY_SECONDS = 60.0
+INDEX_MAX_ATTEMPTS = 5
+
+_SQL_KEYWORDS = {
+    "where", "on", "join", "inner", "left", "right", "full", "cross", "natural", "group", "order",
+    "limit", "having", "union", "select", "as", "using", "outer", "window", "except", "intersect",
+}
+
+def _unquote_identifier(name):
+    if len(name) >= 2 and name[0] in '"[`' and name[-1] in '"]`':
+        return name[1:-1]
+    return name
+
+# Map aliases used in FROM/JOIN clauses to table names
+def _table_aliases(sql_query):
+    aliases = {}
+    pattern = r'\b(?:FROM|JOIN)\s+("[^"]+"|\[[^\]]+\]|`[^`]+`|\w+)(?:\s+(?:AS\s+)?(\w+))?'
+    for match in re.finditer(pattern, sql_query, re.IGNORECASE):
+        table = _unquote_identifier(match.group(1))
+        aliases[table] = table
+        alias = match.group(2)
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+# Identifiers used in filter, join and grouping clauses, filters first since they are most selective
+def _clause_identifiers(sql_query):
+    by_clause = {"WHERE": [], "ON": [], "GROUP": []}
+    clause = r'\b(WHERE|ON|GROUP\s+BY|HAVING)\b(.*?)(?=\b(?:WHERE|JOIN|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|UNION|EXCEPT|INTERSECT|WINDOW)\b|\)|$)'
+    for match in re.finditer(clause, sql_query, re.IGNORECASE | re.DOTALL):
+        kind = match.group(1).split()[0].upper()
+        names = by_clause["GROUP" if kind == "HAVING" else kind]
+        # Drop string literals so quoted values are not mistaken for columns
+        text = re.sub(r"'(?:[^']|'')*'", " ", match.group(2))
+        for identifier in re.findall(r'"[^"]+"|\[[^\]]+\]|`[^`]+`|[A-Za-z_]\w*', text):
+            name = _unquote_identifier(identifier)
+            if name not in names:
+                names.append(name)
+
+    ordered = []
+    for names in by_clause.values():
+        ordered.extend(name for name in names if name not in ordered)
+    return ordered
+
+# Columns of each table that the query reads, collected while it is prepared
+def _columns_read(conn, sql_query):
+    reads = {}
+
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ and arg1 and arg2:
+            reads.setdefault(arg1, [])
+            if arg2 not in reads[arg1]:
+                reads[arg1].append(arg2)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute(f"EXPLAIN {sql_query}")
+    finally:
+        conn.set_authorizer(None)
+    return reads
+
+# Tables the plan scans in full, with columns SQLite builds automatic indexes on
+def _scanned_tables(conn, sql_query, aliases):
+    scans = {}
+    for _, _, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql_query}"):
+        match = re.match(r'SCAN (\S+)(.*)$', detail)
+        if match and 'INDEX' not in match.group(2):
+            scans.setdefault(aliases.get(match.group(1), match.group(1)), [])
+            continue
+        match = re.match(r'SEARCH (\S+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)', detail)
+        if match:
+            columns = re.findall(r'(\w+)\s*[=<>]', match.group(2))
+            scans.setdefault(aliases.get(match.group(1), match.group(1)), []).extend(columns)
+    return scans
+
+def _existing_index_prefixes(conn, table):
+    prefixes = []
+    for _, index_name, *_ in conn.execute("SELECT * FROM pragma_index_list(?)", (table,)):
+        columns = [row[2] for row in conn.execute("SELECT * FROM pragma_index_info(?)", (index_name,))]
+        prefixes.append(columns)
+    return prefixes
+
+# Propose (table, key columns, covered columns) for each scan the query performs
+def suggest_indexes(conn, sql_query):
+    aliases = _table_aliases(sql_query)
+    reads = _columns_read(conn, sql_query)
+    clause_names = _clause_identifiers(sql_query)
+    suggestions = []
+
+    for table, automatic_columns in _scanned_tables(conn, sql_query, aliases).items():
+        table_reads = reads.get(table, [])
+        key_columns = [column for column in automatic_columns if column in table_reads]
+        key_columns += [name for name in clause_names if name in table_reads and name not in key_columns]
+        key_columns = key_columns[:MAX_KEY_COLUMNS]
+        if not key_columns:
+            continue
+
+        # Skip tables already indexed on these leading columns
+        if any(prefix[:len(key_columns)] == key_columns for prefix in _existing_index_prefixes(conn, table)):
+            continue
+
+        # Include every other column the query reads so the index covers it
+        covered = [column for column in table_reads if column not in key_columns]
+        if len(key_columns) + len(covered) > MAX_COVERING_COLUMNS:
+            covered = []
+        suggestions.append((table, key_columns, covered))
+    return suggestions
+
+def _ensure_index_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            columns TEXT NOT NULL,
+            query TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            before_seconds REAL NOT NULL,
+            after_seconds REAL NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+def _database_bytes(conn):
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+# Rough on-disk size of an index over these columns
+def _estimate_index_bytes(conn, table, columns):
+    lengths = ', '.join(f"AVG(LENGTH({quote_identifier(column)}))" for column in columns)
+    row = conn.execute(f"SELECT COUNT(*), {lengths} FROM {quote_identifier(table)}").fetchone()
+    row_count = row[0]
+    return int(row_count * (sum(length or 0 for length in row[1:]) + 16))
+
+def _time_query(db_path, sql_query):
+    result = execute_sql(db_path, sql_query, time_budget=TIMING_BUDGET_SECONDS, max_rows=TIMING_MAX_ROWS)
+    return result.elapsed if isinstance(result, QueryResult) else None
+
+# Create helpful indexes for one accepted query; returns the records of indexes kept
+def advise_indexes(db_path, sql_query):
+    conn = sqlite3.connect(db_path, timeout=INDEX_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+    kept = []
+    try:
+        # Databases are built in WAL mode; older ones are switched over so readers are not blocked
+        conn.execute("PRAGMA journal_mode=WAL")
+        _ensure_index_table(conn)
+        used = conn.execute(f"SELECT COALESCE(SUM(size_bytes), 0) FROM {INDEX_TABLE}").fetchone()[0]
+        budget = max(INDEX_DISK_BUDGET_MIN_BYTES, int(os.path.getsize(db_path) * INDEX_DISK_BUDGET_FRACTION))
+
+        # Drop indexes tried before or over the disk budget before paying for any timing run
+        candidates = []
+        for table, key_columns, covered in suggest_indexes(conn, sql_query):
+            columns = key_columns + covered
+            if _was_rejected(db_path, table, columns):
+                continue
+            estimate = _estimate_index_bytes(conn, table, columns)
+            if used + estimate > budget:
+                logger.info("Skipping index on %s(%s): over the disk budget", table, ', '.join(columns))
+                continue
+            candidates.append((table, columns, estimate))
+        if not candidates:
+            return kept
+
+        before = _time_query(db_path, sql_query)
+        if before is None:
+            return kept
+
+        for table, columns, estimate in candidates:
+            if used + estimate > budget:
+                logger.info("Skipping index on %s(%s): over the disk budget", table, ', '.join(columns))
+                continue
+
+            digest = hashlib.sha256('\0'.join([table] + columns).encode('utf-8')).hexdigest()[:8]
+            index_name = f"idx_auto_{re.sub(r'[^0-9A-Za-z_]', '_', table)}_{digest}"
+            size_before = _database_bytes(conn)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} ON {quote_identifier(table)} "
+                f"({', '.join(quote_identifier(column) for column in columns)})"
+            )
+            size_bytes = max(_database_bytes(conn) - size_before, 0)
+
+            after = _time_query(db_path, sql_query)
+            if after is None or after * MIN_SPEEDUP > before:
+                # Not worth its space: drop it again
+                conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(index_name)}")
+                _remember(_rejected, (str(db_path), table, tuple(columns)))
+                continue
+
+            record = {
+                "index_name": index_name,
+                "table_name": table,
+                "columns": ', '.join(columns),
+                "query": sql_query,
+                "size_bytes": size_bytes,
+                "before_seconds": before,
+                "after_seconds": after,
+                "created_at": time.time()
+            }
+            conn.execute(
+                f"INSERT OR REPLACE INTO {INDEX_TABLE} ({', '.join(record)}) "
+                f"VALUES ({', '.join('?' for _ in record)})",
+                tuple(record.values())
+            )
+            kept.append(record)
+            used += size_bytes
+            before = after
+    finally:
+        conn.close()
+    return kept
+
+# Indexes the advisor has added to a database, newest first
+def list_advised_indexes(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f"SELECT * FROM {INDEX_TABLE} ORDER BY created_at DESC")
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+
+# Index creation runs on one background thread so it never delays a response
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+# Queries already queued or advised, and indexes that were built and dropped again, per database;
+# each query is advised once per process so reruns do not repeat the timing runs
+MAX_REMEMBERED = 1024
+_advised = OrderedDict()
+_rejected = OrderedDict()
+_memory_lock = threading.Lock()
+
+# Record a key, forgetting the oldest ones past MAX_REMEMBERED; returns False if it was already known
+def _remember(memory, key):
+    with _memory_lock:
+        if key in memory:
+            memory.move_to_end(key)
+            return False
+        memory[key] = True
+        while len(memory) > MAX_REMEMBERED:
+            memory.popitem(last=False)
+        return True
+
+def _was_rejected(db_path, table, columns):
+    with _memory_lock:
+        return (str(db_path), table, tuple(columns)) in _rejected
+
+def _is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+def _advise_in_background(db_path, sql_query, attempt=1):
+    try:
+        for record in advise_indexes(db_path, sql_query):
+            logger.info("Added index %s on %s(%s): %.3fs -> %.3fs", record["index_name"], record["table_name"],
+                        record["columns"], record["before_seconds"], record["after_seconds"])
+    except Exception as e:
+        if _is_locked(e) and attempt < INDEX_MAX_ATTEMPTS:
+            # Another connection holds the database; try again later instead of waiting on the lock
+            logger.info("Database busy, retrying index advice in %.0fs: %s", INDEX_RETRY_SECONDS, sql_query)
+            timer = threading.Timer(INDEX_RETRY_SECONDS, _executor.submit,
+                                    (_advise_in_background, db_path, sql_query, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+        logger.exception("Index advice failed for query: %s", sql_query)
+
+# Queue an accepted query for index advice (ignored if the same query was queued before)
+def schedule_index_advice(db_path, sql_query):
+    key = (str(db_path), ' '.join(sql_query.split()).lower())
+    if _remember(_advised, key):
+        _executor.submit(_advise_in_background, str(db_path), sql_query)
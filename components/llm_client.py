@@ -0,0 +1,399 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import groq
+from langchain_core.messages import AIMessage
+
+# Chat model requests in flight at once across all sessions (override with TEXT2SQL_LLM_CONCURRENCY)
+DEFAULT_MAX_CONCURRENCY = 8
+# Requests started per minute, Groq's free-tier limit (override with TEXT2SQL_LLM_RPM, 0 for no limit)
+DEFAULT_REQUESTS_PER_MINUTE = 30
+# Requests that may start back to back before the rate limit applies
+RATE_LIMIT_BURST = 10
+# Retries of a request that hit a rate limit, timeout, connection error or server error
+MAX_RETRIES = 4
+# Exponential backoff: a random delay up to base * 2**attempt, capped (a Retry-After header is a floor)
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+# Calls at or below this temperature count as deterministic, so identical ones may be coalesced
+DETERMINISTIC_TEMPERATURE = 1e-6
+# HTTP statuses worth retrying
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def get_max_concurrency():
+    value = os.environ.get("TEXT2SQL_LLM_CONCURRENCY")
+    return int(value) if value else DEFAULT_MAX_CONCURRENCY
+
+def get_requests_per_minute():
+    value = os.environ.get("TEXT2SQL_LLM_RPM")
+    return float(value) if value else DEFAULT_REQUESTS_PER_MINUTE
+
+def is_retryable(error):
+    if isinstance(error, (groq.APIConnectionError, TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'status_code', None) in RETRY_STATUS_CODES
+
+# Seconds the server asked us to wait (Retry-After or retry-after-ms header), if any
+def _retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+def backoff_delay(attempt, retry_after=None):
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+# Identical prompts to the same model share one request while it is in flight. Only deterministic
+# (temperature 0) calls are coalesced: sampled calls, such as speculative candidates that share a
+# cached model, are meant to get answers of their own, so they get no key.
+def prompt_key(model, messages, kind):
+    temperature = getattr(model, 'temperature', None) or 0.0
+    # ChatGroq sends a temperature of 0 as 1e-8
+    if temperature > DETERMINISTIC_TEMPERATURE:
+        return None
+    payload = json.dumps([kind, getattr(model, 'model_name', None), temperature,
+                          [(message.type, message.content) for message in messages]], default=str)
+    return id(model), hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Semaphore:
+    """Counting semaphore shared by threads and asyncio tasks, granting slots in arrival order"""
+
+    def __init__(self, value):
+        self._value = value
+        self._lock = threading.Lock()
+        # threading.Event for a waiting thread, (loop, future) for a waiting task
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted and waiter[1].done() and not waiter[1].cancelled():
+                # The slot arrived together with the cancellation; pass it on
+                self.release()
+            raise
+
+    def _grant(self, future):
+        # Runs on the waiting task's loop; a task cancelled meanwhile hands the slot to the next waiter
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._value += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._grant, future)
+
+class _TokenBucket:
+    """Requests per second with a burst allowance; each caller reserves a token and waits its turn"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+class _LeaderCancelled(Exception):
+    """The request another caller was waiting on was cancelled; the waiter sends its own"""
+
+# Per-call record filled in by LLMClient (pass it as info=...) for tracing and benchmarks
+def new_call_info():
+    return {"queue_wait_seconds": 0.0, "retries": 0, "coalesced": False, "first_token_at": None}
+
+class LLMClient:
+    """Shared gate for chat model calls: concurrency limit, rate limit, coalescing of identical
+    in-flight prompts, and retries with jittered exponential backoff"""
+
+    def __init__(self, max_concurrency=None, requests_per_minute=None, burst=RATE_LIMIT_BURST,
+                 max_retries=MAX_RETRIES):
+        max_concurrency = max_concurrency if max_concurrency is not None else get_max_concurrency()
+        requests_per_minute = requests_per_minute if requests_per_minute is not None else get_requests_per_minute()
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self._semaphore = _Semaphore(max_concurrency)
+        self._bucket = _TokenBucket(requests_per_minute / 60, burst) if requests_per_minute > 0 else None
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0, "coalesced": 0, "retries": 0, "failures": 0, "in_flight": 0, "waiting": 0,
+            "queue_wait_seconds": 0.0, "max_queue_wait_seconds": 0.0
+        }
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, change in changes.items():
+                self._counters[name] += change
+
+    def _record_wait(self, seconds, info):
+        info["queue_wait_seconds"] += seconds
+        with self._lock:
+            self._counters["queue_wait_seconds"] += seconds
+            self._counters["max_queue_wait_seconds"] = max(self._counters["max_queue_wait_seconds"], seconds)
+
+    # Join the in-flight request for key, or become its leader; returns (future, is_leader)
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counters["coalesced"] += 1
+                return flight, False
+            flight = concurrent.futures.Future()
+            self._flights[key] = flight
+            return flight, True
+
+    def _finish(self, key, flight, response=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(_LeaderCancelled() if isinstance(error, asyncio.CancelledError) else error)
+        else:
+            flight.set_result(response)
+
+    def _retry_or_raise(self, error, attempt, info):
+        if attempt >= self.max_retries or not is_retryable(error) or info["first_token_at"] is not None:
+            # Tokens already passed on cannot be taken back, so a broken stream is not retried
+            self._count(failures=1)
+            raise error
+        info["retries"] += 1
+        self._count(retries=1)
+        return backoff_delay(attempt, _retry_after(error))
+
+    def _send(self, request, info):
+        attempt = 0
+        while True:
+            waiting_since = time.perf_counter()
+            self._count(waiting=1)
+            self._semaphore.acquire()
+            try:
+                try:
+                    if self._bucket is not None:
+                        time.sleep(self._bucket.reserve())
+                finally:
+                    self._count(waiting=-1)
+                self._count(in_flight=1, requests=1)
+                self._record_wait(time.perf_counter() - waiting_since, info)
+                try:
+                    return request()
+                except Exception as e:
+                    delay = self._retry_or_raise(e, attempt, info)
+                finally:
+                    self._count(in_flight=-1)
+            finally:
+                self._semaphore.release()
+            time.sleep(delay)
+            attempt += 1
+
+    async def _asend(self, request, info):
+        attempt = 0
+        while True:
+            waiting_since = time.perf_counter()
+            self._count(waiting=1)
+            try:
+                await self._semaphore.aacquire()
+            except BaseException:
+                self._count(waiting=-1)
+                raise
+            try:
+                try:
+                    if self._bucket is not None:
+                        await asyncio.sleep(self._bucket.reserve())
+                finally:
+                    self._count(waiting=-1)
+                self._count(in_flight=1, requests=1)
+                self._record_wait(time.perf_counter() - waiting_since, info)
+                try:
+                    return await request()
+                except Exception as e:
+                    delay = self._retry_or_raise(e, attempt, info)
+                finally:
+                    self._count(in_flight=-1)
+            finally:
+                self._semaphore.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _call(self, key, request, info):
+        if key is None:
+            return self._send(request, info)
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            info["coalesced"] = True
+            try:
+                return flight.result()
+            except _LeaderCancelled:
+                continue
+        try:
+            response = self._send(request, info)
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, response)
+        return response
+
+    async def _acall(self, key, request, info):
+        if key is None:
+            return await self._asend(request, info)
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            info["coalesced"] = True
+            try:
+                # Shielded so a waiter that is cancelled does not cancel the shared request
+                return await asyncio.shield(asyncio.wrap_future(flight))
+            except _LeaderCancelled:
+                continue
+        try:
+            response = await self._asend(request, info)
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, response)
+        return response
+
+    def invoke(self, model, messages, info=None):
+        """model.invoke(messages) through the gate; info, if given, receives queue wait, retries and coalescing"""
+        info = info if info is not None else new_call_info()
+        return self._call(prompt_key(model, messages, "invoke"), lambda: model.invoke(messages), info)
+
+    async def ainvoke(self, model, messages, info=None):
+        info = info if info is not None else new_call_info()
+        return await self._acall(prompt_key(model, messages, "invoke"), lambda: model.ainvoke(messages), info)
+
+    def stream(self, model, messages, on_token=None, stop=None, info=None):
+        """Stream a response, passing each chunk's text to on_token and abandoning generation once
+        stop(text so far) is true; returns the merged message. A caller coalesced onto another
+        caller's stream gets the whole text in one on_token call when it is done."""
+        info = info if info is not None else new_call_info()
+
+        def request():
+            response = None
+            stream = model.stream(messages)
+            try:
+                for chunk in stream:
+                    if info["first_token_at"] is None:
+                        info["first_token_at"] = time.perf_counter()
+                    response = chunk if response is None else response + chunk
+                    if on_token is not None and chunk.content:
+                        on_token(chunk.content)
+                    if stop is not None and stop(response.content):
+                        break
+            finally:
+                # Closing the stream ends the request, so no further tokens are generated
+                stream.close()
+            return response if response is not None else AIMessage(content="")
+
+        response = self._call(prompt_key(model, messages, ("stream", getattr(stop, '__qualname__', None))),
+                              request, info)
+        if info["coalesced"]:
+            info["first_token_at"] = time.perf_counter()
+            if on_token is not None and response.content:
+                on_token(response.content)
+        return response
+
+    async def astream(self, model, messages, on_token=None, stop=None, info=None):
+        info = info if info is not None else new_call_info()
+
+        async def request():
+            response = None
+            stream = model.astream(messages)
+            try:
+                async for chunk in stream:
+                    if info["first_token_at"] is None:
+                        info["first_token_at"] = time.perf_counter()
+                    response = chunk if response is None else response + chunk
+                    if on_token is not None and chunk.content:
+                        on_token(chunk.content)
+                    if stop is not None and stop(response.content):
+                        break
+            finally:
+                await stream.aclose()
+            return response if response is not None else AIMessage(content="")
+
+        response = await self._acall(prompt_key(model, messages, ("stream", getattr(stop, '__qualname__', None))),
+                                     request, info)
+        if info["coalesced"]:
+            info["first_token_at"] = time.perf_counter()
+            if on_token is not None and response.content:
+                on_token(response.content)
+        return response
+
+    def stats(self):
+        """Request, coalescing, retry and queue-wait counters since the client was created"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queue_wait_seconds"] = round(stats["queue_wait_seconds"], 3)
+        stats["max_queue_wait_seconds"] = round(stats["max_queue_wait_seconds"], 3)
+        return stats
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+# Get the process-wide client every graph node's LLM calls go through
+def get_llm_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient()
+        return _default_client
+
+# Replace the process-wide client (e.g. without a rate limit for benchmarks); returns the previous one
+def set_llm_client(client):
+    global _default_client
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+        return previous
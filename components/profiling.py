@@ -0,0 +1,169 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Table holding per-column profiles inside each generated database
+PROFILE_TABLE = "_text2sql_profiles"
+# Table holding each column's distinct-value sketch, so a refresh can extend its profile
+SKETCH_TABLE = "_text2sql_sketches"
+# Hashes kept per column for distinct counting; counts below this are exact
+DISTINCT_SKETCH_SIZE = 4096
+
+class ColumnProfiler:
+    """Column statistics accumulated chunk by chunk while a table is loaded"""
+
+    def __init__(self, column_types):
+        # column_types: [(column, sql_type), ...] as written to SQLite
+        self.column_types = list(column_types)
+        self.columns = [column for column, _ in self.column_types]
+        self.dtypes = {}
+        self.row_count = 0
+        self.non_null = pd.Series(0, index=self.columns, dtype='int64')
+        self.minimums = pd.Series(np.nan, index=self.columns, dtype='float64')
+        self.maximums = pd.Series(np.nan, index=self.columns, dtype='float64')
+        self._sketches = {column: np.empty(0, dtype=np.uint64) for column in self.columns}
+
+    def update(self, chunk):
+        """Fold one DataFrame chunk into the profile"""
+        if not self.dtypes:
+            self.dtypes = {column: str(dtype) for column, dtype in chunk.dtypes.items()}
+        self.row_count += len(chunk)
+        # Counts and numeric ranges are computed for all columns at once
+        self.non_null = self.non_null.add(chunk.notna().sum(), fill_value=0).astype('int64')
+        numeric = chunk.select_dtypes(include=['number'])
+        if not numeric.empty:
+            columns = numeric.columns
+            self.minimums[columns] = np.fmin(self.minimums[columns].to_numpy(), numeric.min().to_numpy(dtype='float64'))
+            self.maximums[columns] = np.fmax(self.maximums[columns].to_numpy(), numeric.max().to_numpy(dtype='float64'))
+
+        # Keep the smallest value hashes per column (a k-minimum-values sketch)
+        for column in self.columns:
+            values = chunk[column].dropna()
+            if values.empty:
+                continue
+            hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+            sketch = self._sketches[column]
+            if len(sketch) >= DISTINCT_SKETCH_SIZE:
+                # Only hashes below the current k-th smallest can change the sketch
+                hashes = hashes[hashes < sketch[-1]]
+            merged = np.unique(np.concatenate([self._sketches[column], hashes]))
+            self._sketches[column] = merged[:DISTINCT_SKETCH_SIZE]
+
+    @classmethod
+    def resume(cls, column_types, profile, sketches):
+        """Profiler continuing a stored profile (from read_profiles and read_sketches) with more rows"""
+        profiler = cls(column_types)
+        if len(profile) != len(profiler.columns) or len(sketches) != len(profiler.columns):
+            raise ValueError("Stored profile does not match the table's columns")
+        profiler.dtypes = dict(zip(profiler.columns, profile["dtype"]))
+        profiler.row_count = int(profile["row_count"].iloc[0]) if len(profile) else 0
+        profiler.non_null = pd.Series(profile["non_null"].to_numpy(dtype='int64'), index=profiler.columns)
+        profiler.minimums = pd.Series(profile["min_value"].to_numpy(dtype='float64'), index=profiler.columns)
+        profiler.maximums = pd.Series(profile["max_value"].to_numpy(dtype='float64'), index=profiler.columns)
+        profiler._sketches = {column: sketches[position] for position, column in enumerate(profiler.columns)}
+        return profiler
+
+    def _distinct(self, column):
+        sketch = self._sketches[column]
+        if len(sketch) < DISTINCT_SKETCH_SIZE:
+            return len(sketch), False
+        # k-th smallest of uniformly spread hashes estimates the number of distinct values
+        kth = float(sketch[-1]) / float(np.iinfo(np.uint64).max)
+        estimate = int((DISTINCT_SKETCH_SIZE - 1) / kth) if kth > 0 else len(sketch)
+        return min(estimate, int(self.non_null[column])), True
+
+    def records(self, table_name):
+        """Rows for the profile table, one per column"""
+        records = []
+        for position, (column, sql_type) in enumerate(self.column_types):
+            distinct, approximate = self._distinct(column)
+            minimum = self.minimums.get(column)
+            maximum = self.maximums.get(column)
+            records.append((
+                table_name,
+                position,
+                str(column),
+                self.dtypes.get(column, "object"),
+                sql_type,
+                self.row_count,
+                int(self.non_null[column]),
+                self.row_count - int(self.non_null[column]),
+                distinct,
+                int(approximate),
+                None if pd.isna(minimum) else float(minimum),
+                None if pd.isna(maximum) else float(maximum),
+            ))
+        return records
+
+# Store {table: ColumnProfiler} in the profile table (inside the caller's transaction)
+def write_profiles(conn, profiles):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+            table_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            column_name TEXT NOT NULL,
+            dtype TEXT NOT NULL,
+            sql_type TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            non_null INTEGER NOT NULL,
+            missing INTEGER NOT NULL,
+            distinct_count INTEGER NOT NULL,
+            distinct_approximate INTEGER NOT NULL,
+            min_value REAL,
+            max_value REAL,
+            PRIMARY KEY (table_name, position)
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+            table_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            sketch BLOB NOT NULL,
+            PRIMARY KEY (table_name, position)
+        )
+    """)
+    for table_name, profiler in profiles.items():
+        conn.execute(f"DELETE FROM {PROFILE_TABLE} WHERE table_name = ?", (table_name,))
+        conn.executemany(
+            f"INSERT INTO {PROFILE_TABLE} VALUES ({', '.join('?' for _ in range(12))})",
+            profiler.records(table_name)
+        )
+        conn.execute(f"DELETE FROM {SKETCH_TABLE} WHERE table_name = ?", (table_name,))
+        conn.executemany(
+            f"INSERT INTO {SKETCH_TABLE} VALUES (?, ?, ?)",
+            ((table_name, position, profiler._sketches[column].astype('<u8').tobytes())
+             for position, column in enumerate(profiler.columns))
+        )
+
+# Remove the profiles of tables that are no longer in the database
+def delete_profiles(conn, table_names):
+    for table in (PROFILE_TABLE, SKETCH_TABLE):
+        conn.executemany(f"DELETE FROM {table} WHERE table_name = ?", ((name,) for name in table_names))
+
+# Load {table: DataFrame of column profiles} stored when the database was built
+def read_profiles(db_path, table_name=None):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if table_name is None:
+            df = pd.read_sql_query(f"SELECT * FROM {PROFILE_TABLE} ORDER BY table_name, position", conn)
+        else:
+            df = pd.read_sql_query(f"SELECT * FROM {PROFILE_TABLE} WHERE table_name = ? ORDER BY position",
+                                   conn, params=(table_name,))
+    except pd.errors.DatabaseError:
+        return {}
+    finally:
+        conn.close()
+    return {table: group.reset_index(drop=True) for table, group in df.groupby('table_name', sort=False)}
+
+# Load one table's distinct-value sketches as [array per column position] (empty if none were stored)
+def read_sketches(db_path, table_name):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(f"SELECT sketch FROM {SKETCH_TABLE} WHERE table_name = ? ORDER BY position",
+                            (table_name,)).fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+    return [np.frombuffer(sketch, dtype='<u8').astype(np.uint64) for (sketch,) in rows]
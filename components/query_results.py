@@ -0,0 +1,245 @@
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from components.db_utils import QueryResult, estimate_row_bytes
+from components.engines import DEFAULT_ENGINE, ENGINE_ERRORS, check_query, connect_engine, execute_query, time_limit
+from components.result_cache import get_result_cache, normalize_sql
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# Rows shown per page of query results
+RESULT_PAGE_ROWS = 100
+# Time allowed for fetching (or skipping to) one page
+PAGE_TIME_BUDGET_SECONDS = 30.0
+# Rows read from the cursor and written per export chunk
+EXPORT_CHUNK_ROWS = 50_000
+# Time allowed for reading a query's full result for an export
+EXPORT_TIME_BUDGET_SECONDS = 300.0
+# Exports smaller than this stay in memory before spilling to a temporary file
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+EXPORT_FORMATS = ("csv", "parquet") if pq is not None else ("csv",)
+
+class PagedQuery:
+    """Query results read a page at a time instead of all at once.
+
+    Every page is read by its own statement (the query itself for the first page, later pages
+    through LIMIT/OFFSET), which is finished before the page is returned, so a PagedQuery kept
+    in the session holds no cursor or lock on the database between reruns. Since OFFSET still
+    computes the skipped rows, reading far pages this way gets slower the further they are.
+    A result already in the result cache is paged from there without running the query, and
+    so is one cached later (e.g. by an export) before a page past those read is needed.
+    Otherwise the rows of pages read in order from the first one are kept, and once the last
+    page is reached the complete result is cached (unless it grew past the cache's entry limit),
+    so later pages, reruns and other sessions do not run the query again.
+    """
+
+    def __init__(self, db_path, sql_query, page_size=RESULT_PAGE_ROWS, engine=DEFAULT_ENGINE, cache=None):
+        self.db_path = db_path
+        self.sql_query = sql_query
+        self.page_size = page_size
+        self.engine = engine
+        # Total rows, known once the last page has been read
+        self.row_count = None
+        self._lock = threading.Lock()
+        self._cache = cache
+        self._last_page = None
+        # The complete result, when it came from (or went into) the cache
+        self._result = cache.get(db_path, sql_query, engine) if cache is not None else None
+        if self._result is not None:
+            self.columns = list(self._result.columns)
+            self.row_count = len(self._result)
+            return
+        # Leading rows of the result read so far while it may still fit in the cache
+        self._rows = [] if cache is not None else None
+        self._rows_bytes = 0
+        # The first page is read straight away; it also gives the result's column names
+        self._last_page = (0, self._read_page(0))
+
+    # Run one statement for the rows of a page (plus one, to tell whether more follow) and close it
+    def _fetch_page(self, start):
+        conn = connect_engine(self.db_path, self.engine)
+        try:
+            cursor = conn.cursor()
+            try:
+                with time_limit(cursor, PAGE_TIME_BUDGET_SECONDS):
+                    if start == 0:
+                        cursor.execute(self.sql_query)
+                        self.columns = [column[0] for column in cursor.description or []]
+                    else:
+                        # The wrapped query renames duplicate column names, so the first page's names are kept
+                        cursor.execute(f"SELECT * FROM (\n{normalize_sql(self.sql_query)}\n) "
+                                       f"LIMIT {self.page_size + 1} OFFSET {start}")
+                    return cursor.fetchmany(self.page_size + 1)
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _read_page(self, page_number):
+        start = page_number * self.page_size
+        if self._rows is not None and start + self.page_size <= len(self._rows):
+            return pd.DataFrame.from_records(self._rows[start:start + self.page_size], columns=self.columns)
+        if start and self._cache is not None:
+            # The full result may have been cached since, e.g. by an export or another session
+            self._result = self._cache.get(self.db_path, self.sql_query, self.engine)
+            if self._result is not None:
+                self._rows = None
+                self.row_count = len(self._result)
+                return self._result.iloc[start:start + self.page_size].reset_index(drop=True)
+
+        rows = self._fetch_page(start)
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not more and (rows or start == 0):
+            self.row_count = start + len(rows)
+
+        if self._rows is not None and start <= len(self._rows):
+            # Extends the leading rows; pages read after skipping ahead are not kept
+            new_rows = rows[len(self._rows) - start:]
+            self._rows.extend(new_rows)
+            self._rows_bytes += sum(estimate_row_bytes(row) for row in new_rows)
+            if self._rows_bytes > self._cache.max_entry_bytes:
+                # Too large to cache; stop keeping rows for good
+                self._rows = None
+            elif not more:
+                result = pd.DataFrame.from_records(self._rows, columns=self.columns)
+                self._rows = None
+                if self._cache.put(self.db_path, self.sql_query, self.engine, result):
+                    self._result = result
+        return pd.DataFrame.from_records(rows, columns=self.columns)
+
+    def page(self, page_number):
+        """Return one page as a DataFrame"""
+        with self._lock:
+            if self._last_page is not None and self._last_page[0] == page_number:
+                return self._last_page[1]
+
+            if self._result is not None:
+                start = page_number * self.page_size
+                page = self._result.iloc[start:start + self.page_size].reset_index(drop=True)
+            else:
+                page = self._read_page(page_number)
+            self._last_page = (page_number, page)
+            return page
+
+    @property
+    def page_count(self):
+        """Number of pages if the total is known, otherwise None"""
+        if self.row_count is None:
+            return None
+        return max(1, -(-self.row_count // self.page_size))
+
+# Open a paged view of a query (a PagedQuery, or an error string like execute_sql)
+def open_paged_query(db_path, sql_query, page_size=RESULT_PAGE_ROWS, engine=DEFAULT_ENGINE, use_cache=True):
+    error = check_query(db_path, sql_query, engine)
+    if error is not None:
+        return error
+    try:
+        return PagedQuery(db_path, sql_query, page_size, engine, get_result_cache() if use_cache else None)
+    except ENGINE_ERRORS as e:
+        return str(e)
+
+# Read a query in fixed-size chunks from a server-side cursor (always at least one chunk).
+# Served from the result cache when possible; a complete read small enough is cached.
+# The query is interrupted (raising the engine's error) once time_budget is spent.
+def iter_query_chunks(db_path, sql_query, chunk_rows=EXPORT_CHUNK_ROWS, engine=DEFAULT_ENGINE, use_cache=True,
+                      time_budget=EXPORT_TIME_BUDGET_SECONDS):
+    cache = get_result_cache() if use_cache else None
+    result = cache.get(db_path, sql_query, engine) if cache is not None else None
+    if result is not None:
+        for start in range(0, max(len(result), 1), chunk_rows):
+            yield result.iloc[start:start + chunk_rows].reset_index(drop=True)
+        return
+
+    chunks = [] if cache is not None else None
+    chunks_bytes = 0
+    conn = connect_engine(db_path, engine)
+    try:
+        cursor = conn.cursor()
+        with time_limit(cursor, time_budget):
+            cursor.execute(sql_query)
+            columns = [column[0] for column in cursor.description or []]
+            first = True
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows and not first:
+                    break
+                first = False
+                chunk = pd.DataFrame.from_records(rows, columns=columns)
+                if chunks is not None:
+                    chunks.append(chunk)
+                    chunks_bytes += int(chunk.memory_usage(index=True, deep=True).sum())
+                    if chunks_bytes > cache.max_entry_bytes:
+                        chunks = None
+                yield chunk
+                if len(rows) < chunk_rows:
+                    break
+        cursor.close()
+    finally:
+        conn.close()
+    if chunks is not None:
+        cache.put(db_path, sql_query, engine, pd.concat(chunks, ignore_index=True))
+
+# execute_query through the result cache; only complete results (no cap reached, not cancelled) are stored
+def execute_cached(db_path, sql_query, engine=DEFAULT_ENGINE):
+    cache = get_result_cache()
+    started = time.monotonic()
+    result = cache.get(db_path, sql_query, engine)
+    if result is not None:
+        return QueryResult(dataframe=result, elapsed=time.monotonic() - started)
+
+    result = execute_query(db_path, sql_query, engine)
+    if isinstance(result, QueryResult) and not result.truncated and not result.cancelled:
+        cache.put(db_path, sql_query, engine, result.dataframe)
+    return result
+
+def _export_csv(db_path, sql_query, out, engine, time_budget):
+    header = True
+    for chunk in iter_query_chunks(db_path, sql_query, engine=engine, time_budget=time_budget):
+        out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+
+def _export_parquet(db_path, sql_query, out, engine, time_budget):
+    writer = None
+    try:
+        for chunk in iter_query_chunks(db_path, sql_query, engine=engine, time_budget=time_budget):
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(out, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+# Stream a query's full result into a temporary file and return it opened for reading,
+# or an error string (like execute_sql) if the query failed or ran out of time
+def export_query(db_path, sql_query, file_format="csv", engine=DEFAULT_ENGINE,
+                 time_budget=EXPORT_TIME_BUDGET_SECONDS):
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+
+    out = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    started = time.monotonic()
+    try:
+        if file_format == "parquet":
+            _export_parquet(db_path, sql_query, out, engine, time_budget)
+        else:
+            _export_csv(db_path, sql_query, out, engine, time_budget)
+    except ENGINE_ERRORS as e:
+        out.close()
+        if time.monotonic() - started >= time_budget:
+            return f"Export cancelled after {time_budget:g} seconds"
+        return str(e)
+    out.seek(0)
+    return out
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from components.db_utils import read_db_meta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # results are only kept in memory
+    pa = None
+    pq = None
+
+# Memory held by cached results before the least recently used ones spill to disk
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+# Disk used by spilled Parquet files before the least recently used ones are deleted
+DEFAULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+# Results larger than this are written straight to disk instead of held in memory
+SPILL_THRESHOLD_BYTES = 32 * 1024 * 1024
+# Results larger than this are not cached at all
+MAX_ENTRY_BYTES = 512 * 1024 * 1024
+
+# String literals and quoted identifiers are kept as they are; runs of whitespace and comments
+# between them become one space
+_SQL_PARTS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|((?:\s|--[^\n]*|/\*.*?\*/)+)""", re.DOTALL)
+
+# Normalize SQL so queries differing only in layout, comments or a trailing semicolon share an entry
+def normalize_sql(sql_query):
+    normalized = _SQL_PARTS.sub(lambda match: match.group(1) or ' ', sql_query)
+    return normalized.strip().rstrip(';').strip()
+
+# Content fingerprint of an ingested database. Indexes added later by the index advisor do not
+# change it; re-ingesting different data or a new database layout does.
+def database_fingerprint(db_path):
+    digest = read_db_meta(db_path, 'dataset_digest')
+    if digest is None:
+        # Not built by create_db_from_csvs: fall back to the file's size and modification time
+        stat = os.stat(db_path)
+        return f"file:{stat.st_size}:{stat.st_mtime_ns}"
+    return f"{digest}:{read_db_meta(db_path, 'format_version')}"
+
+def make_result_key(fingerprint, sql_query, engine):
+    digest = hashlib.sha256()
+    for part in (fingerprint, engine, normalize_sql(sql_query)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _dataframe_bytes(dataframe):
+    return int(dataframe.memory_usage(index=True, deep=True).sum())
+
+class ResultCache:
+    """Complete query results held in memory with LRU eviction, spilling to Parquet files on disk"""
+
+    def __init__(self, memory_bytes=DEFAULT_MEMORY_BYTES, disk_bytes=DEFAULT_DISK_BYTES, spill_dir=None,
+                 spill_threshold_bytes=SPILL_THRESHOLD_BYTES, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (db_path, DataFrame, bytes) and key -> (db_path, Parquet file, bytes), oldest first
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = 0
+        # Fingerprint each database had when its entries were stored
+        self._fingerprints = {}
+
+        # Without pyarrow there is nowhere to spill: results over the memory budget are dropped
+        self._tmp_dir = None
+        if spill_dir is None and pq is not None:
+            # Removed with the cache, so spilled files never outlive the process
+            self._tmp_dir = tempfile.TemporaryDirectory(prefix="text2sql-results-")
+            spill_dir = self._tmp_dir.name
+        self.spill_dir = Path(spill_dir) if spill_dir is not None and pq is not None else None
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+    # Key for a query on the database's current content; entries stored under an older
+    # fingerprint of the same database are dropped
+    def _key(self, db_path, sql_query, engine):
+        fingerprint = database_fingerprint(db_path)
+        db_path = str(db_path)
+        with self._lock:
+            if self._fingerprints.get(db_path, fingerprint) != fingerprint:
+                self._invalidate(db_path)
+            self._fingerprints[db_path] = fingerprint
+        return make_result_key(fingerprint, sql_query, engine)
+
+    def get(self, db_path, sql_query, engine="sqlite"):
+        """Return the cached result as a DataFrame (shared, do not modify), or None on a miss"""
+        key = self._key(db_path, sql_query, engine)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            entry = self._disk.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        try:
+            dataframe = pq.read_table(entry[1]).to_pandas()
+        except (OSError, pa.ArrowException):
+            # Evicted (or removed) while it was being read
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return dataframe
+
+    def put(self, db_path, sql_query, engine, dataframe):
+        """Store a complete result; returns False if it was too large to cache"""
+        size = _dataframe_bytes(dataframe)
+        if size > self.max_entry_bytes:
+            return False
+        key = self._key(db_path, sql_query, engine)
+        db_path = str(db_path)
+        if size > self.spill_threshold_bytes:
+            with self._lock:
+                self._discard(key)
+            return self._spill(key, db_path, dataframe)
+
+        with self._lock:
+            self._discard(key)
+            self._memory[key] = (db_path, dataframe, size)
+            self._memory_used += size
+            evicted = []
+            while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+                evicted_key, (evicted_path, evicted_frame, evicted_size) = self._memory.popitem(last=False)
+                self._memory_used -= evicted_size
+                evicted.append((evicted_key, evicted_path, evicted_frame))
+        # Parquet files are written outside the lock so lookups are not held up
+        for evicted_key, evicted_path, evicted_frame in evicted:
+            self._spill(evicted_key, evicted_path, evicted_frame)
+        return True
+
+    def _spill(self, key, db_path, dataframe):
+        if self.spill_dir is None:
+            return False
+        path = self.spill_dir / f"{key}.parquet"
+        tmp_path = self.spill_dir / f".{key}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            pq.write_table(pa.Table.from_pandas(dataframe, preserve_index=False), tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException):
+            # e.g. a column mixing types that Arrow cannot store; the result is simply not kept
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return False
+        size = path.stat().st_size
+
+        with self._lock:
+            if key in self._disk:
+                self._disk_used -= self._disk.pop(key)[2]
+            self._disk[key] = (db_path, path, size)
+            self._disk_used += size
+            removed = []
+            while self._disk_used > self.disk_bytes and self._disk:
+                _, (_, removed_path, removed_size) = self._disk.popitem(last=False)
+                self._disk_used -= removed_size
+                removed.append(removed_path)
+        for removed_path in removed:
+            removed_path.unlink(missing_ok=True)
+        return path not in removed
+
+    # Remove one entry from memory and disk (caller holds the lock)
+    def _discard(self, key):
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key)[2]
+        if key in self._disk:
+            _, path, size = self._disk.pop(key)
+            self._disk_used -= size
+            path.unlink(missing_ok=True)
+
+    def _invalidate(self, db_path):
+        stale = [key for entries in (self._memory, self._disk) for key, entry in entries.items()
+                 if entry[0] == db_path]
+        for key in stale:
+            self._discard(key)
+        self._fingerprints.pop(db_path, None)
+
+    def invalidate(self, db_path):
+        """Drop every cached result of a database (e.g. after its tables were reloaded)"""
+        with self._lock:
+            self._invalidate(str(db_path))
+
+    def stats(self):
+        """Hit and miss counters plus the entries and bytes held in memory and on disk"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._memory) + len(self._disk),
+                "memory_bytes": self._memory_used,
+                "spilled_entries": len(self._disk),
+                "disk_bytes": self._disk_used
+            }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Get the process-wide result cache shared by all sessions
+def get_result_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -0,0 +1,175 @@
+import json
+import math
+import re
+from collections import Counter
+
+# Distinct values sampled per text column when the index is built
+SAMPLE_VALUES_PER_COLUMN = 20
+# Longer values are unlikely to be quoted in a question and are not indexed
+MAX_SAMPLE_VALUE_LENGTH = 40
+# Sampled values kept per text column for the LLM prompt (see schema_serializer)
+PROMPT_SAMPLE_VALUES = 3
+# Tables with this many columns or fewer are always sent whole
+KEEP_ALL_COLUMNS_UP_TO = 15
+# Tables scoring below this fraction of the best table are dropped
+TABLE_SCORE_CUTOFF = 0.3
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "each", "for", "from",
+    "give", "has", "have", "how", "i", "in", "is", "it", "list", "many", "me", "much",
+    "of", "on", "or", "per", "show", "that", "the", "their", "there", "this", "to",
+    "was", "were", "what", "when", "where", "which", "who", "with",
+}
+
+# Split identifiers and text into lowercase tokens (snake_case and camelCase aware)
+def tokenize(text):
+    text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', str(text))
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding so "customers" matches "customer"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def _quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+# Format {table: [(column, type), ...]} as the schema string sent to the LLM
+def format_schema(tables):
+    schema_str = ""
+    for table, columns in tables.items():
+        schema_str += f"Table: {table}\n"
+        schema_str += f"Columns: {', '.join(f'{column} ({col_type})' for column, col_type in columns)}\n\n"
+    return schema_str
+
+class SchemaIndex:
+    """BM25 index over table names, column names and sampled column values"""
+
+    def __init__(self, tables, documents, samples=None):
+        # tables: {table: [(column, type), ...]} in schema order
+        self.tables = tables
+        # documents: [(table, column or None, [tokens])]
+        self.documents = documents
+        # samples: {table: {column: [values]}} for text columns
+        self.samples = samples or {}
+
+        self._doc_freq = Counter()
+        for _, _, tokens in documents:
+            self._doc_freq.update(set(tokens))
+        self._avg_length = sum(len(tokens) for _, _, tokens in documents) / max(len(documents), 1)
+
+    @classmethod
+    def build(cls, conn, tables, previous=None, changed=None):
+        """Index a freshly loaded database, sampling distinct values from text columns.
+        With a previous index, only tables in changed are sampled again; the rest are reused."""
+        documents = []
+        samples = {}
+        for table, columns in tables.items():
+            if previous is not None and table in previous.tables and table not in changed:
+                documents.extend(document for document in previous.documents if document[0] == table)
+                if table in previous.samples:
+                    samples[table] = previous.samples[table]
+                continue
+            documents.append((table, None, tokenize(table)))
+            for column, col_type in columns:
+                tokens = tokenize(column) * 2
+                if col_type == "TEXT":
+                    rows = conn.execute(
+                        f"SELECT DISTINCT {_quote_identifier(column)} FROM {_quote_identifier(table)} "
+                        f"WHERE {_quote_identifier(column)} IS NOT NULL LIMIT {SAMPLE_VALUES_PER_COLUMN}"
+                    ).fetchall()
+                    values = [str(value) for (value,) in rows if len(str(value)) <= MAX_SAMPLE_VALUE_LENGTH]
+                    for value in values:
+                        tokens.extend(tokenize(value))
+                    if values:
+                        samples.setdefault(table, {})[column] = values[:PROMPT_SAMPLE_VALUES]
+                documents.append((table, column, tokens))
+        return cls(tables, documents, samples)
+
+    def to_json(self):
+        return json.dumps({
+            "tables": {table: [list(column) for column in columns] for table, columns in self.tables.items()},
+            "documents": [list(document) for document in self.documents],
+            "samples": self.samples,
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        tables = {table: [tuple(column) for column in columns] for table, columns in data["tables"].items()}
+        documents = [tuple(document) for document in data["documents"]]
+        return cls(tables, documents, data.get("samples"))
+
+    def _bm25(self, query_tokens, tokens):
+        if not tokens:
+            return 0.0
+        counts = Counter(tokens)
+        total = len(self.documents)
+        score = 0.0
+        for token in query_tokens:
+            frequency = counts.get(token)
+            if not frequency:
+                continue
+            idf = math.log(1 + (total - self._doc_freq[token] + 0.5) / (self._doc_freq[token] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / self._avg_length)
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return score
+
+    def select(self, question):
+        """Return {table: [(column, type), ...]} restricted to what the question needs, most relevant
+        columns first: matched columns by score, then join keys, then the first and id columns"""
+        query_tokens = set(tokenize(question))
+        table_scores = Counter()
+        column_scores = {}
+        for table, column, tokens in self.documents:
+            score = self._bm25(query_tokens, tokens)
+            if column is None:
+                table_scores[table] += score
+            else:
+                column_scores[(table, column)] = score
+
+        # Table relevance is its own match plus its best matching column
+        best_column = Counter()
+        for (table, _), score in column_scores.items():
+            best_column[table] = max(best_column[table], score)
+        totals = {table: table_scores[table] + best_column[table] for table in self.tables}
+
+        top_score = max(totals.values(), default=0.0)
+        if top_score <= 0:
+            # Nothing matched, so the question gives no basis for pruning
+            return dict(self.tables)
+
+        selected = [table for table in self.tables if totals[table] >= top_score * TABLE_SCORE_CUTOFF]
+
+        # Columns shared between the selected tables are likely join keys
+        column_tables = Counter(column for table in selected for column, _ in self.tables[table])
+        join_keys = {column for column, count in column_tables.items() if count > 1}
+
+        pruned = {}
+        for table in selected:
+            columns = self.tables[table]
+
+            # Schema order within each rank, so the prompt stays stable for the same question
+            def rank(item):
+                position, (column, _) = item
+                score = column_scores.get((table, column), 0)
+                if score > 0:
+                    return (0, -score, position)
+                if column in join_keys:
+                    return (1, 0, position)
+                if position == 0 or 'id' in tokenize(column):
+                    return (2, 0, position)
+                return (3, 0, position)
+
+            # The order matters when the serializer has to cut columns to fit its token budget
+            ranked = sorted(enumerate(columns), key=rank)
+            if len(columns) > KEEP_ALL_COLUMNS_UP_TO:
+                ranked = [item for item in ranked if rank(item)[0] < 3]
+            pruned[table] = [column for _, column in ranked]
+        return pruned
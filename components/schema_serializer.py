@@ -0,0 +1,173 @@
+import logging
+import os
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Schema tokens allowed in each prompt (override with TEXT2SQL_SCHEMA_TOKENS)
+DEFAULT_SCHEMA_TOKEN_BUDGET = 1500
+# Rough characters per token for budgeting, without calling a tokenizer
+CHARS_PER_TOKEN = 4
+# Columns needed before similar names are folded into one entry
+MIN_GROUP_SIZE = 3
+# Sample values shown per column when there is room
+SAMPLE_VALUES_SHOWN = 3
+
+GROUPING_NOTE = ("Note: braces fold several columns into one entry: sales_{1..3} stands for sales_1, sales_2 "
+                 "and sales_3, revenue_{north,south} for revenue_north and revenue_south, and x{1,5}y for x1y "
+                 "and x5y.\n\n")
+
+_NUMBERED = re.compile(r'^(.*?)(\d+)(\D*)$')
+_GROUPED = re.compile(r'^Columns: .*\{', re.MULTILINE)
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def get_schema_token_budget():
+    return _parse_token_budget(os.environ.get("TEXT2SQL_SCHEMA_TOKENS"))
+
+# Cached so an invalid setting is warned about once, not on every prompt
+@lru_cache(maxsize=8)
+def _parse_token_budget(budget):
+    if not budget:
+        return DEFAULT_SCHEMA_TOKEN_BUDGET
+    try:
+        return int(budget)
+    except ValueError:
+        logger.warning("Ignoring TEXT2SQL_SCHEMA_TOKENS=%r (not a whole number); using %d tokens",
+                       budget, DEFAULT_SCHEMA_TOKEN_BUDGET)
+        return DEFAULT_SCHEMA_TOKEN_BUDGET
+
+def _numbers(values):
+    # A contiguous run without leading zeros becomes a range, anything else a list
+    numbers = [int(value) for value in values]
+    if (all(str(number) == value for number, value in zip(numbers, values))
+            and numbers == list(range(numbers[0], numbers[0] + len(numbers)))):
+        return f"{numbers[0]}..{numbers[-1]}"
+    return ','.join(values)
+
+# Fold columns that differ only by a number (amount_1, amount_2, ...) or by their last
+# underscore-separated part (revenue_north, revenue_south, ...) and share a type
+def _group_columns(columns):
+    groups = {}
+    for position, (column, col_type) in enumerate(columns):
+        match = _NUMBERED.match(column)
+        if match:
+            key = ("number", match.group(1), match.group(3), col_type)
+            part = match.group(2)
+        elif '_' in column.strip('_'):
+            prefix, part = column.rsplit('_', 1)
+            key = ("name", prefix + '_', "", col_type)
+        else:
+            key = ("column", column, "", col_type)
+            part = None
+        groups.setdefault(key, []).append((position, column, part))
+
+    entries = []
+    for (kind, prefix, suffix, col_type), members in groups.items():
+        if kind == "column" or len(members) < MIN_GROUP_SIZE:
+            entries.extend((position, column, col_type) for position, column, _ in members)
+            continue
+        parts = [part for _, _, part in members]
+        parts = _numbers(parts) if kind == "number" else ','.join(parts)
+        entries.append((members[0][0], f"{prefix}{{{parts}}}{suffix}", col_type))
+
+    # Keep schema order, then write runs of the same type once: "a, b TEXT; c REAL"
+    entries.sort()
+    runs = []
+    for _, name, col_type in entries:
+        if runs and runs[-1][1] == col_type:
+            runs[-1][0].append(name)
+        else:
+            runs.append(([name], col_type))
+    return '; '.join(f"{', '.join(names)} {col_type}" for names, col_type in runs)
+
+def _quote_value(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _number(value):
+    return f"{value:g}"
+
+# Compact column statistics from stored profiles ({table: DataFrame} from profiling.read_profiles):
+# {table: {column: "0..99.5, ~200 distinct, 10% null"}}, leaving out what a profile does not know
+def profile_summaries(profiles):
+    summaries = {}
+    for table, profile in profiles.items():
+        table_summaries = {}
+        for row in profile.itertuples(index=False):
+            parts = []
+            if row.min_value is not None and row.max_value is not None and row.min_value == row.min_value:
+                parts.append(f"{_number(row.min_value)}..{_number(row.max_value)}")
+            if row.non_null:
+                parts.append(f"{'~' if row.distinct_approximate else ''}{row.distinct_count} distinct")
+            if row.row_count and row.missing:
+                parts.append(f"{max(1, round(100 * row.missing / row.row_count))}% null")
+            if parts:
+                table_summaries[row.column_name] = ', '.join(parts)
+        summaries[table] = table_summaries
+    return summaries
+
+# One table's block; cached so repeated questions and revisions reuse the same text
+@lru_cache(maxsize=1024)
+def _table_block(table, columns, shown_columns=None, samples=(), stats=()):
+    block = f"Table: {table}\nColumns: {_group_columns(columns[:shown_columns])}"
+    if shown_columns is not None and shown_columns < len(columns):
+        block += f" (+{len(columns) - shown_columns} more columns not shown)"
+    block += "\n"
+    if samples:
+        block += "Values: " + '; '.join(
+            f"{column}: {', '.join(_quote_value(value) for value in values)}" for column, values in samples
+        ) + "\n"
+    if stats:
+        block += "Stats: " + '; '.join(f"{column}: {summary}" for column, summary in stats) + "\n"
+    return block + "\n"
+
+def _render(blocks):
+    schema_str = ''.join(blocks)
+    return (GROUPING_NOTE + schema_str) if _GROUPED.search(schema_str) else schema_str
+
+def _truncated_blocks(tables, token_budget):
+    # Share the budget between tables by width; each keeps its leading columns, which
+    # SchemaIndex.select puts in order of relevance (matched columns, then join keys)
+    total_columns = sum(len(columns) for columns in tables.values()) or 1
+    blocks = []
+    for table, columns in tables.items():
+        share = token_budget * len(columns) / total_columns
+        shown = len(columns)
+        while shown > 1 and estimate_tokens(_table_block(table, columns, shown)) > share:
+            shown = max(1, shown * 3 // 4)
+        blocks.append(_table_block(table, columns, shown))
+    return blocks
+
+# Serialize {table: [(column, type), ...]} for the LLM in at most about token_budget tokens.
+# samples ({table: {column: [values]}}) and then stats ({table: {column: summary}}, see
+# profile_summaries) are added column by column only while they fit.
+def serialize_schema(tables, samples=None, token_budget=None, stats=None):
+    token_budget = token_budget or get_schema_token_budget()
+    tables = {table: tuple(tuple(column) for column in columns) for table, columns in tables.items()}
+    blocks = {table: _table_block(table, columns) for table, columns in tables.items()}
+
+    used = estimate_tokens(_render(blocks.values()))
+    if used > token_budget:
+        return _render(_truncated_blocks(tables, token_budget))
+
+    # Sample values come first: they show how filter values are spelled
+    shown = {table: {"samples": (), "stats": ()} for table in tables}
+    for kind, extras in (("samples", samples), ("stats", stats)):
+        for table, columns in tables.items():
+            table_extras = (extras or {}).get(table) or {}
+            for column, _ in columns:
+                value = table_extras.get(column)
+                if not value:
+                    continue
+                if kind == "samples":
+                    value = tuple(value[:SAMPLE_VALUES_SHOWN])
+                candidate = {**shown[table], kind: shown[table][kind] + ((column, value),)}
+                block = _table_block(table, columns, **candidate)
+                cost = estimate_tokens(block) - estimate_tokens(blocks[table])
+                if used + cost > token_budget:
+                    continue
+                shown[table], blocks[table] = candidate, block
+                used += cost
+    return _render(blocks.values())
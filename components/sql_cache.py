@@ -0,0 +1,110 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Default location of the persistent question-to-SQL cache
+DEFAULT_CACHE_PATH = Path("./data") / "sql_cache.db"
+# Maximum number of cached answers before least recently used ones are evicted
+DEFAULT_MAX_ENTRIES = 5_000
+# Cached answers older than this are treated as misses and removed
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Normalize a question so trivially different phrasings share a cache entry
+def normalize_question(question):
+    question = question.strip().lower()
+    question = re.sub(r'\s+', ' ', question)
+    return question.rstrip(' ?.!')
+
+# Fingerprint of the schema plus the normalized question (and the SQL dialect, other than SQLite)
+def make_cache_key(table_schemas, question, engine="sqlite"):
+    digest = hashlib.sha256()
+    digest.update(table_schemas.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_question(question).encode('utf-8'))
+    # SQLite keys stay as they were before other engines existed
+    if engine != "sqlite":
+        digest.update(b'\0')
+        digest.update(engine.encode('utf-8'))
+    return digest.hexdigest()
+
+class SQLCache:
+    """Accepted SQL stored in a local SQLite file with LRU and TTL eviction"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_last_used ON sql_cache (last_used_at)")
+
+    def get(self, key):
+        """Return the cached SQL for a key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql, created_at FROM sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE sql_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, question, sql):
+        """Store accepted SQL and evict the least recently used entries over the limit"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_cache (key, question, sql, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, question, sql, now, now)
+            )
+            self._conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM sql_cache WHERE key IN ("
+                "SELECT key FROM sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.execute("COMMIT")
+
+    def stats(self):
+        """Hit and miss counters for this process plus the number of stored entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Get the process-wide cache stored at DEFAULT_CACHE_PATH
+def get_sql_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SQLCache()
+        return _default_cache
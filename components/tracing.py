@@ -0,0 +1,157 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from langchain_core.runnables import RunnableLambda
+
+from components.llm_client import new_call_info, get_llm_client
+
+# JSON lines file trace records are appended to (override with TEXT2SQL_TRACE_PATH, empty to disable)
+DEFAULT_TRACE_PATH = Path("./data") / "traces.jsonl"
+# Size at which the trace file is rotated to <name>.1 (replacing the previous one) and started afresh
+TRACE_MAX_BYTES = 16 * 1024 * 1024
+
+# LLM calls made by the node currently running (shared with threads and tasks it starts)
+_llm_calls = contextvars.ContextVar("llm_calls", default=None)
+
+# Prompt and completion token counts from a chat model response, if the provider reported them
+def _token_usage(response):
+    usage = getattr(response, 'usage_metadata', None) or {}
+    if usage:
+        return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+    token_usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage') or {}
+    return token_usage.get('prompt_tokens', 0), token_usage.get('completion_tokens', 0)
+
+def _record_llm_call(started, response, info):
+    calls = _llm_calls.get()
+    if calls is None:
+        return
+    prompt_tokens, completion_tokens = _token_usage(response)
+    first_token_at = info["first_token_at"]
+    calls.append({
+        # Time spent waiting for a concurrency slot or rate-limit token is counted separately
+        "seconds": time.perf_counter() - started - info["queue_wait_seconds"],
+        "first_token_seconds": first_token_at - started if first_token_at is not None else None,
+        "queue_wait_seconds": info["queue_wait_seconds"],
+        "retries": info["retries"],
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens
+    })
+
+# model.invoke through the shared LLM client, recording latency and token usage for the current node's trace
+def invoke_model(model, messages):
+    started, info = time.perf_counter(), new_call_info()
+    response = get_llm_client().invoke(model, messages, info=info)
+    _record_llm_call(started, response, info)
+    return response
+
+async def ainvoke_model(model, messages):
+    started, info = time.perf_counter(), new_call_info()
+    response = await get_llm_client().ainvoke(model, messages, info=info)
+    _record_llm_call(started, response, info)
+    return response
+
+# model.stream that records the call like invoke_model; on_token gets each chunk's text, and
+# generation is abandoned as soon as stop(text so far) is true
+def stream_model(model, messages, on_token=None, stop=None):
+    started, info = time.perf_counter(), new_call_info()
+    response = get_llm_client().stream(model, messages, on_token=on_token, stop=stop, info=info)
+    _record_llm_call(started, response, info)
+    return response
+
+async def astream_model(model, messages, on_token=None, stop=None):
+    started, info = time.perf_counter(), new_call_info()
+    response = await get_llm_client().astream(model, messages, on_token=on_token, stop=stop, info=info)
+    _record_llm_call(started, response, info)
+    return response
+
+def _trace_record(node_name, state, update, config, started, started_at, calls):
+    update = update or {}
+    return {
+        "run_id": ((config or {}).get("configurable") or {}).get("thread_id", ""),
+        "node": node_name,
+        "revision": update.get('revision', state.get('revision', 0)),
+        "started_at": started_at,
+        "wall_seconds": time.perf_counter() - started,
+        "llm_calls": len(calls),
+        # Summed over calls, so parallel candidates can add up to more than the wall time
+        "llm_seconds": sum(call["seconds"] for call in calls),
+        # Time to the first streamed token of the node's first streamed call
+        "first_token_seconds": next(
+            (call["first_token_seconds"] for call in calls if call["first_token_seconds"] is not None), None),
+        # Time the node's calls waited for the shared client's concurrency and rate limits
+        "queue_wait_seconds": sum(call["queue_wait_seconds"] for call in calls),
+        "retries": sum(call["retries"] for call in calls),
+        "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "completion_tokens": sum(call["completion_tokens"] for call in calls)
+    }
+
+# Wrap a node so its update also carries a trace record (wall time, LLM time, tokens, revision)
+def traced_node(node_name, func, afunc=None):
+    def node(state, config=None):
+        calls = []
+        token = _llm_calls.set(calls)
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            update = func(state)
+        finally:
+            _llm_calls.reset(token)
+        record = _trace_record(node_name, state, update, config, started, started_at, calls)
+        return {**(update or {}), "trace": [record]}
+
+    async def anode(state, config=None):
+        calls = []
+        token = _llm_calls.set(calls)
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            update = await afunc(state)
+        finally:
+            _llm_calls.reset(token)
+        record = _trace_record(node_name, state, update, config, started, started_at, calls)
+        return {**(update or {}), "trace": [record]}
+
+    return RunnableLambda(node, afunc=anode if afunc is not None else None, name=node_name)
+
+# Per-node totals of a question's trace records, in the order nodes first ran
+def summarize_trace(records):
+    summary = {}
+    for record in records:
+        totals = summary.setdefault(record["node"], {
+            "node": record["node"], "runs": 0, "wall_seconds": 0.0, "llm_seconds": 0.0,
+            "queue_wait_seconds": 0.0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0
+        })
+        totals["runs"] += 1
+        for field in ("wall_seconds", "llm_seconds", "queue_wait_seconds", "retries", "prompt_tokens",
+                      "completion_tokens"):
+            # Records written before queue waits and retries were traced lack those fields
+            totals[field] += record.get(field, 0)
+    return list(summary.values())
+
+_write_lock = threading.Lock()
+
+def get_trace_path():
+    path = os.environ.get("TEXT2SQL_TRACE_PATH")
+    if path is None:
+        return DEFAULT_TRACE_PATH
+    return Path(path) if path else None
+
+# Append one question's trace records, tagged with shared fields such as model and mode, as JSON lines.
+# The file is rotated once it reaches TRACE_MAX_BYTES, so at most two files' worth is kept.
+def write_trace_records(records, path=None, **fields):
+    path = path or get_trace_path()
+    if path is None or not records:
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = ''.join(json.dumps({**fields, **record}) + "\n" for record in records)
+    with _write_lock:
+        try:
+            if path.stat().st_size + len(lines) > TRACE_MAX_BYTES:
+                os.replace(path, path.with_name(f"{path.name}.1"))
+        except FileNotFoundError:
+            pass
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
@@ -1,5 +1,11 @@
 import streamlit as st
 import pandas as pd
+import uuid
+from functools import partial
+
+from components.engines import ENGINES, available_engines
+from components.query_results import EXPORT_FORMATS, export_query
+from components.tracing import summarize_trace
 
 def render_sidebar():
     """Render the sidebar with configuration options"""
@@ -14,6 +20,23 @@ def render_sidebar():
         st.header("⚙️ Agent Settings")
         max_revisions = st.slider("Maximum SQL Revisions", 1, 5, 2)
         temperature = st.slider("LLM Temperature", 0.0, 1.0, 0.0, 0.1)
+        graph_mode = st.selectbox(
+            "Agent Mode",
+            ["auto", "fast", "full", "speculative"],
+            help="auto: fast for simple single-table questions, full for the rest. "
+                 "fast: one writer call, accepted if it runs; falls back to the validator loop if it fails. "
+                 "full: writer, local check, LLM validator and improver loop. "
+                 "speculative: several candidate queries in parallel, first one that runs is accepted."
+        )
+        engine = st.selectbox(
+            "Query Engine",
+            ENGINES,
+            help="sqlite: row store the CSVs are loaded into. "
+                 "duckdb: columnar copy of the same tables, faster for aggregations over many rows. "
+                 "The SQL the agents write follows the chosen engine's dialect."
+        )
+        if engine not in available_engines():
+            st.caption("DuckDB is not installed (`pip install duckdb`); queries run on SQLite.")
         
         st.header("📊 Sample Questions")
         st.markdown("""
@@ -23,56 +46,198 @@ def render_sidebar():
         - What are the top 5 [items] by [metric]?
         """)
         
-    return api_key, model_name, max_revisions, temperature
+    return api_key, model_name, max_revisions, temperature, graph_mode, engine
+
+def render_ingest_progress(file_names):
+    """Render one progress bar per uploaded file and return a callback that updates them"""
+    bars = {name: st.progress(0.0, text=f"{name}: waiting") for name in file_names}
+    
+    def update(file_name, fraction, rows_loaded):
+        state = "done" if fraction >= 1.0 else "loading"
+        bars[file_name].progress(min(fraction, 1.0), text=f"{file_name}: {rows_loaded:,} rows ({state})")
+    
+    return update
 
-def render_data_preview(dataframes):
-    """Render data preview with statistics"""
+def render_data_preview(table_handles):
+    """Render data preview with statistics read from the profiles stored at ingest"""
     # Enhanced Data Preview Section
-    tables = list(dataframes.keys())
+    tables = list(table_handles.keys())
     if tables:
         selected_table = st.selectbox("Select a table to preview", tables)
         
         if selected_table:
-            df = dataframes[selected_table]
+            table = table_handles[selected_table]
+            profile = table.profile()
             
             # Display table statistics
             col1, col2, col3, col4 = st.columns(4)
+            if not profile.empty:
+                row_count = int(profile["row_count"].iloc[0])
+                column_count = len(profile)
+                missing_total = int(profile["missing"].sum())
+                numeric_count = int(profile["sql_type"].isin(["INTEGER", "REAL"]).sum())
+            else:
+                row_count, column_count = table.row_count, len(table.columns)
+                missing_total, numeric_count = None, None
             with col1:
-                st.metric("Rows", df.shape[0])
+                st.metric("Rows", row_count)
             with col2:
-                st.metric("Columns", df.shape[1])  # Fixed from df.shape[0]
+                st.metric("Columns", column_count)
             with col3:
-                numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-                st.metric("Numeric Columns", len(numeric_cols))
+                st.metric("Numeric Columns", numeric_count if numeric_count is not None else "–")
             with col4:
-                st.metric("Missing Values", df.isna().sum().sum())
+                st.metric("Missing Values", missing_total if missing_total is not None else "–")
             
             # Allow user to select how many rows to display
             num_rows = st.slider("Number of rows to display", 5, 100, 10)
             
             # Show data with profiling info
             with st.expander(f"Preview of {selected_table}", expanded=True):
-                st.dataframe(df.head(num_rows), use_container_width=True)
+                # Only the rows on screen are read from SQLite
+                st.dataframe(table.head(num_rows), use_container_width=True)
                 
                 # Column information
                 st.subheader("Column Information")
-                column_info = []
-                for col in df.columns:
-                    col_type = str(df[col].dtype)
-                    unique_vals = df[col].nunique()
-                    missing = df[col].isna().sum()
-                    
-                    column_info.append({
-                        "Column": col,
-                        "Type": col_type,
-                        "Unique Values": unique_vals,
-                        "Missing Values": missing,
-                        "% Missing": f"{(missing/len(df)*100):.2f}%"
-                    })
+                if profile.empty:
+                    st.caption("No column profile stored for this table")
+                    return
                 
-                st.dataframe(pd.DataFrame(column_info), use_container_width=True)
+                missing_pct = profile["missing"] / profile["row_count"].clip(lower=1) * 100
+                column_info = pd.DataFrame({
+                    "Column": profile["column_name"],
+                    "Type": profile["sql_type"],
+                    # Large columns are counted with a sketch, marked with ~
+                    "Unique Values": [
+                        f"~{count:,}" if approximate else f"{count:,}"
+                        for count, approximate in zip(profile["distinct_count"], profile["distinct_approximate"])
+                    ],
+                    "Missing Values": profile["missing"],
+                    "% Missing": missing_pct.map(lambda pct: f"{pct:.2f}%"),
+                    "Min": profile["min_value"],
+                    "Max": profile["max_value"]
+                })
+                
+                st.dataframe(column_info, use_container_width=True)
 
 def render_schema_view(table_schemas):
     """Render database schema view"""
     with st.expander("Database Schema", expanded=True):
-        st.code(table_schemas)
\ No newline at end of file
+        st.code(table_schemas)
+
+def render_index_report(indexes):
+    """Render indexes added by the index advisor and the speedup they gave"""
+    if not indexes:
+        return
+    with st.expander(f"Automatic Indexes ({len(indexes)})", expanded=False):
+        st.dataframe(pd.DataFrame([{
+            "Index": index["index_name"],
+            "Table": index["table_name"],
+            "Columns": index["columns"],
+            "Size (KB)": round(index["size_bytes"] / 1024),
+            "Before (s)": round(index["before_seconds"], 3),
+            "After (s)": round(index["after_seconds"], 3),
+            "Speedup": f"{index['before_seconds'] / max(index['after_seconds'], 1e-6):.1f}x"
+        } for index in indexes]), use_container_width=True)
+
+def render_timing_breakdown(trace):
+    """Render where the time and tokens of one question went, node by node"""
+    if not trace:
+        return
+    summary = summarize_trace(trace)
+    total_seconds = sum(record["wall_seconds"] for record in trace)
+    llm_seconds = sum(record["llm_seconds"] for record in trace)
+    queue_seconds = sum(record.get("queue_wait_seconds", 0) for record in trace)
+    tokens = sum(record["prompt_tokens"] + record["completion_tokens"] for record in trace)
+    
+    with st.expander(f"⏱️ Timing: {total_seconds:.2f}s in nodes, {llm_seconds:.2f}s in LLM calls, "
+                     f"{queue_seconds:.2f}s queued, {tokens:,} tokens"):
+        st.dataframe(pd.DataFrame([{
+            "Node": node["node"],
+            "Runs": node["runs"],
+            "Wall (s)": round(node["wall_seconds"], 3),
+            "LLM (s)": round(node["llm_seconds"], 3),
+            "Queued (s)": round(node["queue_wait_seconds"], 3),
+            "Retries": node["retries"],
+            "Prompt Tokens": node["prompt_tokens"],
+            "Completion Tokens": node["completion_tokens"],
+            "Share": f"{node['wall_seconds'] / max(total_seconds, 1e-9):.0%}"
+        } for node in summary]), use_container_width=True)
+        st.caption("Runs in order: " + " → ".join(
+            f"{record['node']} (rev {record['revision']}, {record['wall_seconds']:.2f}s)" for record in trace))
+
+def render_sql_cache_stats(stats):
+    """Render question-to-SQL cache counters in the sidebar"""
+    with st.sidebar:
+        st.header("⚡ SQL Cache")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Hits", stats["hits"])
+        with col2:
+            st.metric("Misses", stats["misses"])
+        with col3:
+            st.metric("Entries", stats["entries"])
+
+def render_result_cache_stats(stats):
+    """Render query result cache counters in the sidebar"""
+    with st.sidebar:
+        st.header("📦 Result Cache")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Hits", stats["hits"])
+        with col2:
+            st.metric("Misses", stats["misses"])
+        with col3:
+            st.metric("Entries", stats["entries"])
+        st.caption(f"{stats['memory_bytes'] / (1024 * 1024):.1f} MB in memory, "
+                   f"{stats['spilled_entries']} results ({stats['disk_bytes'] / (1024 * 1024):.1f} MB) spilled to disk")
+
+def render_llm_client_stats(stats):
+    """Render shared LLM client counters (requests, coalescing, retries, queue wait) in the sidebar"""
+    with st.sidebar:
+        st.header("🚦 LLM Calls")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Requests", stats["requests"])
+        with col2:
+            st.metric("Coalesced", stats["coalesced"])
+        with col3:
+            st.metric("Retries", stats["retries"])
+        st.caption(f"{stats['in_flight']} in flight, {stats['waiting']} waiting, "
+                   f"{stats['queue_wait_seconds']:.1f}s queued in total (longest {stats['max_queue_wait_seconds']:.1f}s), "
+                   f"{stats['failures']} failed")
+
+# Deferred download data: the exported file, or an error Streamlit reports as a failed download
+def _export_or_raise(db_path, sql_query, file_format, engine):
+    result = export_query(db_path, sql_query, file_format, engine)
+    if isinstance(result, str):
+        raise RuntimeError(result)
+    return result
+
+def render_paged_results(paged_query, db_path, sql_query):
+    """Render one page of query results plus streaming export buttons"""
+    page_number = st.number_input("Page", min_value=1, value=1)
+    page = paged_query.page(page_number - 1)
+    st.dataframe(page, use_container_width=True)
+    
+    first_row = (page_number - 1) * paged_query.page_size
+    if page.empty:
+        st.caption(f"No rows on this page ({paged_query.row_count:,} rows in total)"
+                   if paged_query.row_count is not None else "No rows on this page")
+    elif paged_query.row_count is not None:
+        st.caption(f"Rows {first_row + 1:,}–{first_row + len(page):,} of {paged_query.row_count:,}")
+    else:
+        st.caption(f"Rows {first_row + 1:,}–{first_row + len(page):,} (more available; pages far into a "
+                   f"large result load more slowly, so download it to see all rows)")
+    
+    # Exports stream the full result from a separate cursor only when clicked
+    export_id = uuid.uuid4().hex[:8]
+    mime_types = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+    columns = st.columns(len(EXPORT_FORMATS))
+    for column, file_format in zip(columns, EXPORT_FORMATS):
+        with column:
+            st.download_button(
+                label=f"Download Results as {file_format.upper()}",
+                data=partial(_export_or_raise, db_path, sql_query, file_format, paged_query.engine),
+                file_name=f"query_results_{export_id}.{file_format}",
+                mime=mime_types[file_format]
+            )